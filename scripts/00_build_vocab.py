@@ -3,36 +3,44 @@
 ────────────────────────────────────────────────────────
 Parse the local data/cleaned/ordo.owl (v4.5) and
 write English labels + synonyms to data/cleaned/ordo_terms.tsv
+
+Streams the RDF/XML with lxml.iterparse – we only need two
+predicates, so no triple store is built and RAM stays flat.
 """
 
 import pathlib, sys
-from rdflib import Graph, RDFS, Literal, Namespace, URIRef
+from lxml import etree
 
 BASE = pathlib.Path(__file__).resolve().parents[1]
 OWL  = BASE / "data" / "cleaned" / "ordo.owl"
 TSV  = BASE / "data" / "cleaned" / "ordo_terms.tsv"
 
-OBO  = Namespace("http://www.geneontology.org/formats/oboInOwl#")
-HAS_SYN = URIRef(OBO + "hasExactSynonym")
+RDF      = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+LABEL    = "{http://www.w3.org/2000/01/rdf-schema#}label"
+HAS_SYN  = "{http://www.geneontology.org/formats/oboInOwl#}hasExactSynonym"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
 
 if not OWL.exists():
     sys.exit(f"❌  {OWL} not found – place the unzipped ordo.owl there first.")
 
 print("🔍  Parsing ORDO …")
-g = Graph()
-g.parse(OWL, format="xml")
-
 terms = set()
 
-# English rdfs:label
-for _, _, lbl in g.triples((None, RDFS.label, None)):
-    if isinstance(lbl, Literal) and (lbl.language in (None, "en")):
-        terms.add(lbl.value.strip())
-
-# Exact synonyms
-for _, _, syn in g.triples((None, HAS_SYN, None)):
-    if isinstance(syn, Literal):
-        terms.add(syn.value.strip())
+for _, elem in etree.iterparse(str(OWL), events=("end",)):
+    if elem.tag in (LABEL, HAS_SYN):
+        # literals only (skip rdf:resource references)
+        if elem.get(RDF + "resource") is None and elem.text:
+            # English rdfs:label / any exact synonym
+            if elem.tag == HAS_SYN or elem.get(XML_LANG) in (None, "en"):
+                terms.add(elem.text.strip())
+        continue
+
+    # drop every finished top-level resource so RAM stays flat
+    parent = elem.getparent()
+    if parent is not None and parent.getparent() is None:
+        elem.clear()
+        while elem.getprevious() is not None:
+            del parent[0]
 
 TSV.write_text("\n".join(sorted(terms)), encoding="utf-8")
 print(f"✅  Saved {len(terms):,} terms → {TSV}")
@@ -8,13 +8,16 @@ our rare-disease vocabulary (ordo_terms.tsv).
 USAGE  (test single month first):
     python scripts/01_find_candidate_subs.py 2024-01
 
+Several months are scanned in parallel, one worker process each.
+
 Outputs CSV:
     data/meta/candidate_subreddits.csv
 Columns: name, subscribers, public_description, matched_term
 """
 
-import sys, json, pathlib, urllib.request, io, csv, zstandard as zstd
-from rapidfuzz import fuzz, process
+import os, re, sys, json, pathlib, urllib.request, zstandard as zstd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import ahocorasick, orjson
 
 BASE      = pathlib.Path(__file__).resolve().parents[1]
 VOCAB_TSV = BASE / "data" / "cleaned" / "ordo_terms.tsv"
@@ -25,46 +28,135 @@ TMP_DIR.mkdir(parents=True, exist_ok=True)
 # ------------------------------------------------------------------ #
 # 1.  Load vocabulary (lower-case) + acronyms
 terms = [t.strip() for t in VOCAB_TSV.read_text(encoding="utf-8").splitlines() if t.strip()]
-terms_lower = {t.lower() for t in terms}
+terms_lower = frozenset(t.lower() for t in terms)
+SHORT_TERM  = 5            # shorter terms must stand as whole words
 acronyms    = {t for t in terms if t.isupper() and 3 <= len(t) <= 6}
 
+# one Aho-Corasick automaton over the whole vocabulary (built once):
+# a single pass over each blob instead of one `in` test per term.
+# STORE_LENGTH keeps only the key length per node (no Python object
+# per term); the matched term is sliced back out of the text.
+automaton = ahocorasick.Automaton(ahocorasick.STORE_LENGTH)
+for t in terms_lower - {a.lower() for a in acronyms}:
+    automaton.add_word(t)
+automaton.make_automaton()
+
+# acronyms (ALS, SMA…) only as whole, upper-case words – "als" ≠ "also"
+ACR_RE = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(acronyms, key=len, reverse=True))) + r")\b"
+) if acronyms else None
+
+# byte-level pre-filter over raw dump chunks: the same terms as UTF-8
+# bytes seen through latin-1 (1 byte = 1 char), so lines can be
+# rejected before they are split, decoded or JSON-parsed.
+# Chunks are only ASCII case-folded, and dumps written with the default
+# json.dumps(ensure_ascii=True) hold non-ASCII text as \uXXXX escapes –
+# so every term goes in both raw and JSON-escaped, in the lower / Title /
+# UPPER spellings of its non-ASCII letters ("Alström", "ALSTRÖM" …).
+def prefilter_keys(term: str) -> set[str]:
+    keys = set()
+    for v in (term, term.title(), term.upper()):
+        keys.add(v.encode("utf-8").lower().decode("latin-1"))
+        keys.add(json.dumps(v)[1:-1].lower())        # ensure_ascii escapes
+    return keys
+
+prefilter = ahocorasick.Automaton(ahocorasick.STORE_LENGTH)
+for t in terms_lower:
+    for key in prefilter_keys(t):
+        prefilter.add_word(key)
+prefilter.make_automaton()
+
+# the automata are the vocabulary from here on – drop the Python copies
+# so every worker process only carries the compact C structures
+del terms, terms_lower, acronyms
+
+def on_word_boundary(txt: str, start: int, end: int) -> bool:
+    """True if txt[start:end] is not glued to letters/digits on either side."""
+    return ((start == 0 or not txt[start - 1].isalnum())
+            and (end == len(txt) or not txt[end].isalnum()))
+
 def text_has_term(txt: str) -> str | None:
-    """Return the first matching term or None."""
+    """
+    Return the leftmost-longest matching term or None: the match that
+    starts first in the text, the longest of those starting there – not
+    the longest term anywhere in it.
+    """
     low = txt.lower()
-    # fast exact match
-    for t in terms_lower:
-        if t in low:
-            return t
-    # fuzzy for acronyms (ALS, SMA…)
-    res, score, _ = process.extractOne(low, acronyms, scorer=fuzz.partial_ratio)
-    return res if score >= 95 else None
+    for end, n in automaton.iter_long(low):
+        start = end - n + 1
+        if n >= SHORT_TERM or on_word_boundary(low, start, end + 1):
+            return low[start:end + 1]
+    m = ACR_RE.search(txt) if ACR_RE else None
+    return m.group(0) if m else None
 
 # ------------------------------------------------------------------ #
-# 2.  Download + stream-read .zst
-URL_TMPL = "https://files.pushshift.io/reddit/subreddits/meta/subreddits_meta_only_{month}.zst"
+# 2.  CSV rows pre-encoded as bytes (no csv.DictWriter per hit)
+FIELDNAMES = ["name", "subscribers", "public_description", "matched_term"]
+HEADER     = (",".join(FIELDNAMES) + "\r\n").encode("utf-8")
+
+def quoted(val: str) -> str:
+    return '"' + val.replace('"', '""') + '"'
 
-def scan_month(month: str, writer):
+def encode_row(name: str, subscribers, desc: str, term: str) -> bytes:
+    subscribers = "" if subscribers is None else subscribers
+    desc = desc.replace("\r", " ").replace("\n", " ")
+    return (f"{quoted(name)},{subscribers},{quoted(desc)},{quoted(term)}\r\n"
+            .encode("utf-8"))
+
+# ------------------------------------------------------------------ #
+# 3.  Download + stream-read .zst
+URL_TMPL  = "https://files.pushshift.io/reddit/subreddits/meta/subreddits_meta_only_{month}.zst"
+READ_SIZE = 1 << 22        # 4 MiB of decompressed dump per read
+
+def candidate_lines(reader):
+    """
+    Yield the raw lines of a dump that contain a pre-filter hit
+    (ASCII case-folded).  The automaton scans whole READ_SIZE chunks,
+    so lines without a hit never become Python objects at all.
+    """
+    tail = b""
+    while True:
+        chunk = reader.read(READ_SIZE)
+        buf   = tail + chunk
+        cut   = buf.rfind(b"\n") + 1 if chunk else len(buf)   # EOF: flush
+        buf, tail = buf[:cut], buf[cut:]
+
+        line_end = -1
+        for end, _ in prefilter.iter(buf.lower().decode("latin-1")):
+            if end < line_end:
+                continue                    # this line was already yielded
+            start    = buf.rfind(b"\n", 0, end) + 1
+            line_end = buf.find(b"\n", end)
+            if line_end < 0:
+                line_end = len(buf)
+            yield buf[start:line_end]
+        if not chunk:
+            return
+
+def scan_month(month: str) -> list[bytes]:
+    """Return the matching CSV rows of one monthly dump (runs in a worker)."""
+    rows = []
     fn = TMP_DIR / f"{month}.zst"
     if not fn.exists():
         print(f"⏬  {month}.zst")
         urllib.request.urlretrieve(URL_TMPL.format(month=month), fn)
     dctx = zstd.ZstdDecompressor(max_window_size=2147483648)
     with fn.open("rb") as fh, dctx.stream_reader(fh) as reader:
-        buff = io.TextIOWrapper(reader, encoding="utf-8", errors="ignore")
-        for line in buff:
-            doc = json.loads(line)
+        for line in candidate_lines(reader):
+            try:
+                doc = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
             name  = doc.get("name", "")
             title = doc.get("title", "") or ""
             desc  = doc.get("public_description", "") or ""
             blob  = " ".join([name, title, desc])
             hit   = text_has_term(blob)
             if hit:
-                writer.writerow({
-                    "name": name,
-                    "subscribers": doc.get("subscribers", ""),
-                    "public_description": desc[:300],  # truncate
-                    "matched_term": hit
-                })
+                rows.append(encode_row(name, doc.get("subscribers"),
+                                       desc[:300],  # truncate
+                                       hit))
+    return rows
 
 # ------------------------------------------------------------------ #
 if __name__ == "__main__":
@@ -72,15 +164,17 @@ if __name__ == "__main__":
         sys.exit("Usage:  python scripts/01_find_candidate_subs.py YYYY-MM [YYYY-MM …]")
     months = sys.argv[1:]
     header_written = OUT_CSV.exists()
-    with OUT_CSV.open("a", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile,
-                                fieldnames=["name","subscribers",
-                                            "public_description","matched_term"])
+    with OUT_CSV.open("ab") as csvfile:
         if not header_written:
-            writer.writeheader()
-        for m in months:
-            try:
-                scan_month(m, writer)
-            except Exception as exc:
-                print(f"⚠️  Skipped {m}: {exc}")
+            csvfile.write(HEADER)
+        # workers scan, only this process writes the CSV
+        workers = min(len(months), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(scan_month, m): m for m in months}
+            for fut in as_completed(futures):
+                m = futures[fut]
+                try:
+                    csvfile.writelines(fut.result())
+                except Exception as exc:
+                    print(f"⚠️  Skipped {m}: {exc}")
     print(f"✅  Candidate list updated → {OUT_CSV}")
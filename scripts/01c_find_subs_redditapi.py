@@ -3,6 +3,11 @@
 ------------------------------------------------------------
 Live-search Reddit for every rare-disease term and build
 data/meta/candidate_subreddits.csv  with automatic 429 back-off.
+
+Talks to Reddit's OAuth endpoints with aiohttp: CONCURRENCY terms
+in flight, paced by the X-Ratelimit-* headers of every response,
+rows funnelled through one writer task.  Every endpoint used returns
+subscribers + description inline, so a term costs 1-2 requests.
 """
 
 import os
@@ -10,10 +15,13 @@ import csv
 import time
 import pathlib
 import re
+import random
+import asyncio
 
 from dotenv import load_dotenv, find_dotenv
-import praw
-from prawcore import NotFound, Forbidden, TooManyRequests
+import aiohttp
+import orjson
+import pandas as pd
 
 # ---------- paths / creds ----------------------------------------
 BASE  = pathlib.Path(__file__).resolve().parents[1]
@@ -24,17 +32,16 @@ OUT   = META / "candidate_subreddits.csv"
 
 load_dotenv(find_dotenv())
 
-reddit = praw.Reddit(
-    client_id=os.getenv("REDDIT_CLIENT_ID"),
-    client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-    username=os.getenv("REDDIT_USERNAME"),
-    password=os.getenv("REDDIT_PASSWORD"),
-    user_agent=os.getenv("REDDIT_USER_AGENT"),
-)
-reddit.read_only = True
+TOKEN_URL   = "https://www.reddit.com/api/v1/access_token"
+API_URL     = "https://oauth.reddit.com"
+USER_AGENT  = os.getenv("REDDIT_USER_AGENT") or "RareDiseaseScraper/0.1"
+CONCURRENCY = 32      # terms in flight
+CHUNK       = 1024    # terms scheduled per gather()
+MAX_TRIES   = 6       # per request, 429 / 5xx / network errors
 
 # ---------- vocabulary -------------------------------------------
-NUMERIC_RE = re.compile(r"^[0-9\s/.,-]+$")
+NUMERIC_RE  = re.compile(r"^[0-9\s/.,-]+$")
+SUB_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_]{1,20}$")   # valid r/<name>
 terms = [
     t.strip()
     for t in VOCAB.read_text(encoding="utf-8").splitlines()
@@ -44,76 +51,169 @@ print(f"[SCAN] {len(terms):,} non-numeric terms to query")
 
 # ---------- resume support ---------------------------------------
 if OUT.exists():
-    with OUT.open(encoding="utf-8", errors="ignore") as fh:
-        next(fh, None)
-        seen = {line.split(",")[0].lower() for line in fh}
+    # C parser; also copes with quoted multi-line descriptions
+    names = pd.read_csv(OUT, usecols=["name"], dtype=str, keep_default_na=False,
+                        encoding="utf-8", encoding_errors="ignore")["name"]
+    seen = set(names.str.lower())
     mode = "a"
     print(f"[SCAN] Resuming - {len(seen)} subs already collected")
 else:
     seen, mode = set(), "w"
 
-# ---------- helper with retry ------------------------------------
-def safe_call(func, *args, **kw):
-    """Call a PRAW method; back off 70 s on 429."""
-    while True:
-        try:
-            return func(*args, **kw)
-        except TooManyRequests as exc:
-            print("[BACKOFF] 429 TooManyRequests – sleeping 70 s")
-            time.sleep(70)
-        except Exception as err:
-            # log but return empty list / None so loop continues
-            print("[WARN] API error:", err)
-            return None
+# ---------- rate limiting ----------------------------------------
+class RateLimiter:
+    """
+    Token bucket fed by Reddit's own headers: X-Ratelimit-Remaining
+    tokens are left until the window resets in X-Ratelimit-Reset s.
+    """
+
+    def __init__(self):
+        self.remaining = None          # unknown until the first response
+        self.reset_at  = 0.0
+        self.lock      = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            if self.remaining is not None and self.remaining < 1:
+                delay = self.reset_at - time.monotonic()
+                if delay > 0:
+                    print(f"[BACKOFF] rate window used up – sleeping {delay:.0f} s")
+                    await asyncio.sleep(delay)
+                self.remaining = None
+            elif self.remaining is not None:
+                self.remaining -= 1
+
+    def update(self, headers):
+        remaining = headers.get("x-ratelimit-remaining")
+        reset     = headers.get("x-ratelimit-reset")
+        if remaining is not None and reset is not None:
+            self.remaining = float(remaining)
+            self.reset_at  = time.monotonic() + float(reset)
+
+# ---------- OAuth client -----------------------------------------
+class RedditAPI:
+    """Minimal read-only OAuth client with retry + exponential back-off."""
+
+    def __init__(self, session: aiohttp.ClientSession):
+        self.session = session
+        self.limiter = RateLimiter()
+        self.auth    = {}
+
+    async def login(self):
+        creds = aiohttp.BasicAuth(os.getenv("REDDIT_CLIENT_ID") or "",
+                                  os.getenv("REDDIT_CLIENT_SECRET") or "")
+        if os.getenv("REDDIT_USERNAME"):
+            data = {"grant_type": "password",
+                    "username": os.getenv("REDDIT_USERNAME"),
+                    "password": os.getenv("REDDIT_PASSWORD") or ""}
+        else:
+            data = {"grant_type": "client_credentials"}
+        async with self.session.post(TOKEN_URL, auth=creds, data=data) as r:
+            r.raise_for_status()
+            token = (await r.json())["access_token"]
+        self.auth = {"Authorization": f"bearer {token}"}
+
+    async def get(self, path: str, **params):
+        """GET an OAuth endpoint; None on 403/404 or after MAX_TRIES."""
+        for attempt in range(MAX_TRIES):
+            await self.limiter.acquire()
+            try:
+                async with self.session.get(API_URL + path, params=params,
+                                            headers=self.auth) as r:
+                    self.limiter.update(r.headers)
+                    if r.status == 401:            # token expired
+                        await self.login()
+                        continue
+                    if r.status in (403, 404):
+                        return None
+                    if r.status == 429 or r.status >= 500:
+                        raise aiohttp.ClientResponseError(
+                            r.request_info, r.history, status=r.status)
+                    if r.status != 200:
+                        print(f"[WARN] API error {r.status} on {path} {params}")
+                        return None
+                    body = orjson.loads(await r.read())
+                    if not isinstance(body, dict):
+                        raise ValueError("response is not a JSON object")
+                    return body
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    ValueError) as err:      # incl. a 200 with a broken body
+                delay = min(70, 2 ** attempt + random.random())
+                print(f"[BACKOFF] {err!r} – sleeping {delay:.0f} s")
+                await asyncio.sleep(delay)
+        print(f"[WARN] giving up on {path} {params}")
+        return None
+
+# ---------- per-term query ---------------------------------------
+async def query_term(api: RedditAPI, term: str) -> list[dict]:
+    """Exact name match first, else the top-3 search results."""
+    found = []
+    # an exact match can only be r/<term> itself – skip the name search
+    # and fetch its about page directly (terms with spaces can't match)
+    if SUB_NAME_RE.fullmatch(term):
+        about = await api.get(f"/r/{term}/about")
+        data  = (about or {}).get("data", {})
+        if data.get("display_name") and not data.get("over18"):
+            found = [data]
+
+    if not found:
+        listing = await api.get("/subreddits/search", q=term, limit=3)
+        found = [child.get("data", {})
+                 for child in (listing or {}).get("data", {}).get("children", [])]
+
+    hits = []
+    for data in found:
+        name = data.get("display_name", "")
+        if not name or name.lower() in seen:
+            continue
+        seen.add(name.lower())
+        hits.append({"name": name,
+                     "subscribers": data.get("subscribers") or 0,
+                     "public_description": (data.get("public_description") or "")[:300],
+                     "matched_term": term})
+    return hits
+
+# ---------- single CSV writer ------------------------------------
+async def write_rows(queue: asyncio.Queue, writer: csv.DictWriter):
+    while (row := await queue.get()) is not None:
+        writer.writerow(row)
 
 # ---------- main loop --------------------------------------------
-with OUT.open(mode, newline="", encoding="utf-8") as fh:
-    writer = csv.DictWriter(
-        fh,
-        fieldnames=["name", "subscribers", "public_description", "matched_term"],
-    )
-    if mode == "w":
-        writer.writeheader()
-
-    for idx, term in enumerate(terms, 1):
-        hits = safe_call(
-            reddit.subreddits.search_by_name,
-            term,
-            exact=True,
-            include_nsfw=False,
-        ) or []
-
-        if not hits:
-            hits = safe_call(reddit.subreddits.search, term, limit=3) or []
-
-        for sub in hits:
-            name_lc = sub.display_name.lower()
-            if name_lc in seen:
-                continue
-            seen.add(name_lc)
-
-            # subscribers / description may raise 403/404
-            try:
-                subs_cnt = sub.subscribers
-            except (Forbidden, NotFound):
-                subs_cnt = 0
-            try:
-                desc = (sub.public_description or "")[:300]
-            except (Forbidden, NotFound):
-                desc = ""
-
-            writer.writerow(
-                {
-                    "name": sub.display_name,
-                    "subscribers": subs_cnt,
-                    "public_description": desc,
-                    "matched_term": term,
-                }
+async def main():
+    sem   = asyncio.Semaphore(CONCURRENCY)
+    queue = asyncio.Queue()
+
+    async def bounded(api, term):
+        async with sem:
+            for row in await query_term(api, term):
+                await queue.put(row)
+
+    # one keep-alive pool for every request of the run
+    connector = aiohttp.TCPConnector(limit_per_host=16, keepalive_timeout=60,
+                                     ttl_dns_cache=300)
+    timeout   = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     headers={"User-Agent": USER_AGENT}) as session:
+        api = RedditAPI(session)
+        await api.login()
+
+        with OUT.open(mode, newline="", encoding="utf-8") as fh:
+            writer = csv.DictWriter(
+                fh,
+                fieldnames=["name", "subscribers", "public_description", "matched_term"],
             )
+            if mode == "w":
+                writer.writeheader()
+            writer_task = asyncio.create_task(write_rows(queue, writer))
 
-        if idx % 60 == 0:
-            print(f"[SCAN] {idx}/{len(terms)} terms - {len(seen)} unique subs")
+            for start in range(0, len(terms), CHUNK):
+                chunk = terms[start:start + CHUNK]
+                await asyncio.gather(*(bounded(api, t) for t in chunk))
+                print(f"[SCAN] {start + len(chunk)}/{len(terms)} terms - "
+                      f"{len(seen)} unique subs")
 
-        time.sleep(1.0)  # baseline delay (works with back-off)
+            await queue.put(None)
+            await writer_task
 
+asyncio.run(main())
 print(f"[SCAN] DONE - {len(seen)} subs saved \u2192 {OUT}")
@@ -17,24 +17,49 @@ Features
 • Opens CSVs in UTF-8 (errors=ignore)  → Windows-safe
 • Skips rows already labelled          → resume support
 • Prints progress every 50 rows
+• CONCURRENCY requests in flight     → rows written in completion order
+• 429s honour Retry-After            → exponential back-off otherwise
+• Answers cached on disk by prompt   → re-runs cost nothing
+• No medical hint in name/desc       → "no" without an API call
 """
 
 import csv
 import pathlib
 import os
-import time
+import re
+import random
+import asyncio
+import hashlib
+import diskcache
+import httpx
 from dotenv import load_dotenv, find_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
+
+from http_retry import retry_after_s
 
 # ---------- paths -------------------------------------------------
 BASE   = pathlib.Path(__file__).resolve().parents[1]
 CAND   = BASE / "data" / "meta" / "candidate_subreddits.csv"
 OUT    = BASE / "data" / "meta" / "verified_subreddits.csv"
 OUT.parent.mkdir(parents=True, exist_ok=True)
+CACHE  = diskcache.Cache(str(BASE / "data" / "meta" / ".gpt_cache"))
 
 # ---------- OpenAI client ----------------------------------------
+MODEL       = "gpt-4o-mini"
+CONCURRENCY = 32
+MAX_TRIES   = 6
+
 load_dotenv(find_dotenv())
-client = OpenAI()
+# one pooled HTTP/2 connection set, kept alive across all requests
+client = AsyncOpenAI(
+    max_retries=0,                    # retries handled in label_row
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=CONCURRENCY,
+                            max_keepalive_connections=CONCURRENCY,
+                            keepalive_expiry=60),
+    ),
+)
 
 PROMPT_TEMPLATE = (
     "You are a medical domain expert.\n"
@@ -49,61 +74,117 @@ PROMPT_TEMPLATE = (
     "Reply with one keyword only: rare, common, or not_disease."
 )
 
+# stems of which at least one must appear in "<name> <description>"
+# before a row is worth sending to GPT
+MEDICAL_HINTS = (
+    "syndrome", "disease", "disorder", "deficiency", "dystroph", "sclerosis",
+    "cancer", "tumor", "tumour", "carcinoma", "itis", "osis", "oma", "emia",
+    "pathy", "plasia", "algia", "cyst", "chronic", "genetic", "mutation",
+    "rare", "patient", "diagnos", "symptom", "treatment", "therap", "medic",
+    "illness", "condition", "health", "surgery", "doctor", "support",
+    "caregiver", "warrior", "pain", "affected", "living with", "people who have",
+)
+WORD_RE  = re.compile(r"[a-z]{4,}")
+ALNUM_RE = re.compile(r"[^a-z0-9]")
+
 # ---------- helper ------------------------------------------------
-def label_row(row: dict) -> str:
+def obviously_not_disease(row: dict) -> bool:
+    """
+    Cheap gate before the LLM: neither the name nor the description
+    carries a medical hint or a word of the matched ORDO term.
+    """
+    text = f'{row["name"]} {row.get("public_description") or ""}'.lower()
+    if any(h in text for h in MEDICAL_HINTS):
+        return False
+    compact = ALNUM_RE.sub("", text)      # "MyastheniaGravis", "lam_support"
+    term    = (row.get("matched_term") or "").lower()
+    return not any(w in compact for w in WORD_RE.findall(term))
+
+def cache_key(prompt: str) -> str:
+    return hashlib.blake2b(f"{MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+
+async def label_row(row: dict) -> str:
     """Return yes / no / error based on GPT classification."""
     prompt = PROMPT_TEMPLATE.format(
         name=row["name"], desc=row["public_description"]
     )
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        keyword = resp.choices[0].message.content.strip().lower()
-    except Exception as exc:
-        print("[WARN] OpenAI error:", exc, flush=True)
+    key = cache_key(prompt)
+    if key in CACHE:
+        return CACHE[key]
+
+    for attempt in range(MAX_TRIES):
+        try:
+            resp = await client.chat.completions.create(
+                model=MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+            )
+            keyword = resp.choices[0].message.content.strip().lower()
+            break
+        except RateLimitError as exc:
+            # seconds or an HTTP-date; unparsable → plain back-off
+            delay = max(retry_after_s(exc.response.headers),
+                        2 ** attempt + random.random())
+            print(f"[BACKOFF] 429 - sleeping {delay:.1f} s", flush=True)
+            await asyncio.sleep(delay)
+        except Exception as exc:
+            print("[WARN] OpenAI error:", exc, flush=True)
+            return "error"
+    else:
         return "error"
 
     if keyword == "rare":
-        return "yes"
-    if keyword in {"common", "not_disease"}:
-        return "no"
-    return "error"
+        label = "yes"
+    elif keyword in {"common", "not_disease"}:
+        label = "no"
+    else:
+        return "error"
+    CACHE[key] = label
+    return label
 
 # ---------- main --------------------------------------------------
-with CAND.open(encoding="utf-8", errors="ignore") as src, \
-     OUT.open("w", newline="", encoding="utf-8") as dst:
-
-    reader = csv.DictReader(src)
-    fieldnames = reader.fieldnames + ["gpt_label"]
-    writer = csv.DictWriter(dst, fieldnames=fieldnames)
-    writer.writeheader()
-
-    total_rows = sum(1 for _ in open(CAND, encoding="utf-8", errors="ignore")) - 1
-    src.seek(0); next(reader)  # reset after counting
-
-    yes_count = 0
-    for idx, row in enumerate(reader, 1):
-        # resume support
-        if row.get("gpt_label"):
+async def main():
+    sem = asyncio.Semaphore(CONCURRENCY)
+    skipped = 0
+
+    async def bounded(row: dict) -> dict:
+        nonlocal skipped
+        if row.get("gpt_label"):           # resume support
+            return row
+        if obviously_not_disease(row):
+            row["gpt_label"] = "no"
+            skipped += 1
+            return row
+        async with sem:
+            row["gpt_label"] = await label_row(row)
+        return row
+
+    with CAND.open(encoding="utf-8", errors="ignore") as src, \
+         OUT.open("w", newline="", encoding="utf-8") as dst:
+
+        reader = csv.DictReader(src)
+        fieldnames = reader.fieldnames + ["gpt_label"]
+        writer = csv.DictWriter(dst, fieldnames=fieldnames)
+        writer.writeheader()
+
+        tasks = [bounded(row) for row in reader]
+        total_rows = len(tasks)     # the reader is consumed once, no pre-count
+
+        yes_count = 0
+        for idx, done in enumerate(asyncio.as_completed(tasks), 1):
+            row = await done
             if row["gpt_label"] == "yes":
                 yes_count += 1
             writer.writerow(row)
-            continue
-
-        row["gpt_label"] = label_row(row)
-        if row["gpt_label"] == "yes":
-            yes_count += 1
-        writer.writerow(row)
 
-        if idx % 50 == 0 or idx == total_rows:
-            print(
-                f"[GPT] {idx}/{total_rows} processed - {yes_count} yes",
-                flush=True,
-            )
+            if idx % 50 == 0 or idx == total_rows:
+                print(
+                    f"[GPT] {idx}/{total_rows} processed - {yes_count} yes",
+                    flush=True,
+                )
 
-        time.sleep(0.5)  # ~120 req/min
+    print(f"[GPT] pre-filter answered {skipped} rows without an API call",
+          flush=True)
 
+asyncio.run(main())
 print(f"[GPT] DONE - verified list at {OUT}", flush=True)
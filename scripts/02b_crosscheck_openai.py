@@ -8,6 +8,10 @@ For every row in data/meta/verified_subreddits_crosschecked.csv:
   (prevalence < 1 / 2 000) or not.
 * Write the answer into the CSV (columns keep, prevalence_est).
 * Produce data/meta/rare_subs_crosschecked.txt with the names to keep.
+
+The same disease is usually matched by many subreddits, so GPT is asked
+once per distinct term (CONCURRENCY at a time) and the verdicts are
+fanned back out to the rows.
 """
 
 import sys
@@ -16,25 +20,45 @@ if hasattr(sys.stdout, "reconfigure"):          # PY ≥ 3.7
     sys.stdout.reconfigure(encoding="utf-8")
 # -------------------------------------------------------------------
 
-import csv, json, os, re, shutil, time
+import asyncio, csv, hashlib, json, os, random, re
 from pathlib import Path
 
+import diskcache
+import httpx
 import openai
-from openai import RateLimitError, APIConnectionError, Timeout
+from openai import RateLimitError, APIConnectionError, APITimeoutError
+
+from http_retry import retry_after_s
 
 # ---------- CONFIG --------------------------------------------------
 MODEL        = "gpt-4o"                 # or "gpt-4o-mini" if that is your tier
 INPUT_CSV    = Path("data/meta/verified_subreddits_crosschecked.csv")
 BACKUP_CSV   = INPUT_CSV.with_suffix(".bak")
+TMP_CSV      = INPUT_CSV.with_suffix(".tmp")
 OUTPUT_TXT   = Path("data/meta/rare_subs_crosschecked.txt")
+CACHE        = diskcache.Cache("data/meta/.gpt_cache")   # shared with 02_verify
+CONCURRENCY  = 16
+MAX_TRIES    = 6                        # per term; then keep = "error"
 # --------------------------------------------------------------------
 
+# one pooled HTTP/2 connection set, kept alive across all requests
+client = openai.AsyncOpenAI(
+    max_retries=0,                      # retries handled in classify
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=CONCURRENCY,
+                            max_keepalive_connections=CONCURRENCY,
+                            keepalive_expiry=60),
+    ),
+)
 
-def query_prevalence(disease: str) -> tuple[str, str]:
+
+async def query_prevalence(disease: str, sem: asyncio.Semaphore) -> tuple[str, str]:
     """
     Return ("yes" | "no", prevalence_string)
     keep == "yes"  -> prevalence < 1 / 2 000   (rare)
     keep == "no"   -> prevalence >= 1 / 2 000  OR not a disease
+    Answers are memoised on disk (keyed by prompt hash).
     """
     prompt = (
         "You are a medical librarian.\n"
@@ -50,12 +74,16 @@ def query_prevalence(disease: str) -> tuple[str, str]:
         "```\n\n"
         f"Now evaluate:\n{disease}"
     )
-
-    resp = openai.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
+    key = hashlib.blake2b(f"{MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+    if key in CACHE:
+        return CACHE[key]
+
+    async with sem:                     # held for the request only
+        resp = await client.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0
+        )
     reply = resp.choices[0].message.content
 
     # Extract the JSON inside ```json ... ```
@@ -68,56 +96,85 @@ def query_prevalence(disease: str) -> tuple[str, str]:
     prevalence = data.get("prevalence", "")
 
     if verdict == "yes":
-        return "yes", prevalence
+        result = ("yes", prevalence)
     elif verdict in ("no", "not_disease"):
-        return "no", prevalence
+        result = ("no", prevalence)
     else:
         raise ValueError(f"Unexpected verdict value: {verdict}")
+    CACHE[key] = result
+    return result
+
+
+async def classify(disease: str, sem: asyncio.Semaphore) -> tuple[str, str]:
+    """
+    query_prevalence with retries: 429s honour Retry-After, timeouts and
+    dropped connections back off exponentially – outside the semaphore,
+    so a sleeping term doesn't block the others.  ("error", "") if the
+    term never gets a usable answer.
+    """
+    for attempt in range(MAX_TRIES):
+        try:
+            return await query_prevalence(disease, sem)
+        except (RateLimitError, APITimeoutError, APIConnectionError) as exc:
+            if attempt + 1 == MAX_TRIES:
+                break
+            delay = 2 ** attempt + random.random()
+            if isinstance(exc, RateLimitError):
+                delay = max(delay, retry_after_s(exc.response.headers))
+            print(f"[BACKOFF] {type(exc).__name__} on '{disease}' - "
+                  f"sleeping {delay:.1f} s")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            print(f"[WARN] Parse/API error on '{disease}': {e}; skip")
+            return "error", ""
+    print(f"[WARN] giving up on '{disease}' after {MAX_TRIES} tries")
+    return "error", ""
+
+
+async def classify_all(diseases: list[str]) -> list[tuple[str, str]]:
+    sem = asyncio.Semaphore(CONCURRENCY)
+    return await asyncio.gather(*(classify(d, sem) for d in diseases))
 
 
 def main() -> None:
-    # 1. back-up the original CSV
-    shutil.copy(INPUT_CSV, BACKUP_CSV)
-    print(f"[INFO] Backup → {BACKUP_CSV}")
+    # an interrupted older run may have left only the backup behind
+    source = INPUT_CSV if INPUT_CSV.exists() else BACKUP_CSV
+    with source.open(newline="", encoding="utf-8") as fin:
+        reader = csv.DictReader(fin)
+        rows = list(reader)
+
+    # one GPT query per distinct disease string (first spelling wins)
+    unique: dict[str, str] = {}
+    for row in rows:
+        term = row["matched_term"].strip()
+        unique.setdefault(term.lower(), term)
+    print(f"[XCHK] {len(rows)} rows → {len(unique)} distinct terms to query")
+
+    verdicts = dict(zip(unique, asyncio.run(classify_all(list(unique.values())))))
 
     rare_names: list[str] = []
     updated_rows: list[dict] = []
+    for row in rows:
+        keep, preval = verdicts[row["matched_term"].strip().lower()]
+        row["keep"] = keep
+        row["prevalence_est"] = preval
+        updated_rows.append(row)
 
-    with INPUT_CSV.open(newline="", encoding="utf-8") as fin:
-        reader = csv.DictReader(fin)
-        total_rows = sum(1 for _ in fin)
-        fin.seek(0)
-        reader = csv.DictReader(fin)          # re-initialise iterator
-
-        for idx, row in enumerate(reader, start=1):
-            disease = row["matched_term"]
-            try:
-                keep, preval = query_prevalence(disease)
-            except (RateLimitError, Timeout):
-                print(f"[WARN] Rate-limit / timeout on '{disease}', retry in 20 s")
-                time.sleep(20)
-                keep, preval = "no", ""
-            except APIConnectionError as e:
-                print(f"[WARN] Connection error on '{disease}': {e}; skip")
-                keep, preval = "no", ""
-            except Exception as e:
-                print(f"[WARN] Parse/API error on '{disease}': {e}; skip")
-                keep, preval = "no", ""
-
-            row["keep"] = keep
-            row["prevalence_est"] = preval
-            updated_rows.append(row)
-
-            if keep == "yes":
-                rare_names.append(row["name"])
-
-            print(f"[XCHK] {idx}/{total_rows} processed – kept {len(rare_names)}")
-
-    # 2. overwrite the CSV with new data
-    with INPUT_CSV.open("w", newline="", encoding="utf-8") as fout:
+        if keep == "yes":
+            rare_names.append(row["name"])
+
+    print(f"[XCHK] {len(rows)} processed – kept {len(rare_names)}")
+
+    # 2. write the new CSV aside, then back up + swap it in – the input
+    #    is only touched once every verdict is in
+    with TMP_CSV.open("w", newline="", encoding="utf-8") as fout:
         writer = csv.DictWriter(fout, fieldnames=reader.fieldnames)
         writer.writeheader()
         writer.writerows(updated_rows)
+    if INPUT_CSV.exists():
+        os.replace(INPUT_CSV, BACKUP_CSV)
+        print(f"[INFO] Backup → {BACKUP_CSV}")
+    os.replace(TMP_CSV, INPUT_CSV)
 
     # 3. write the list of rare subreddit names
     OUTPUT_TXT.parent.mkdir(parents=True, exist_ok=True)
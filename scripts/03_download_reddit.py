@@ -2,11 +2,16 @@
 # -*- coding: utf-8 -*-
 """
 03_download_reddit.py   –   robust Reddit scraper
-Writes UTF-8 .jsonl.gz per subreddit into data/raw/
+Writes UTF-8 .jsonl.zst per subreddit into data/raw/
 """
 
-import os, sys, time, gzip, json, pathlib, datetime as dt
-import praw, prawcore
+import os, sys, time, pathlib, queue, threading, datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+import orjson
+import praw, prawcore, requests
+from requests.adapters import HTTPAdapter
+
+from dump_io import open_zst
 
 # ── console: force UTF-8 on Windows so arrows work; fallback to plain ASCII
 try:
@@ -21,6 +26,8 @@ RAW_DIR   = pathlib.Path("data/raw");      RAW_DIR.mkdir(parents=True, exist_ok=
 SUB_LIST  = pathlib.Path("data/meta/rare_subs_crosschecked.txt")
 MIN_YEAR  = 2015
 BIG_SLEEP = 120
+MAX_THREAD = 5000          # bigger threads: keep the post, skip its comments
+WORKERS   = int(os.getenv("SCRAPE_WORKERS", "4"))   # keep modest: one app's quota
 CLIENT_ID     = os.getenv("REDDIT_CLIENT_ID")
 CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 USER_AGENT    = "RareDiseaseScraper/0.1 by u/<yourname>"
@@ -43,36 +50,86 @@ def comment_to_dict(c):
         created_utc=int(c.created_utc), score=c.score, body=c.body or "",
     )
 
-def dump(path, objs):
-    with gzip.open(path, "wt", encoding="utf-8") as gz:
-        for o in objs:
-            gz.write(json.dumps(o, ensure_ascii=False) + "\n")
+def dump(gz, obj):
+    gz.write(orjson.dumps(obj) + b"\n")      # UTF-8 bytes, no str round-trip
 
-# ── scrape one sub ───────────────────────────────────────────
-def scrape_sub(reddit, name):
-    outfile = RAW_DIR / f"r_{name}.jsonl.gz"
-    if outfile.exists():
-        return True
+_DONE = object()            # end-of-stream marker on the record queue
 
-    try:
-        sub  = reddit.subreddit(name)
-        buff = []
+def fetch_records(sub, q, stop):
+    """
+    Producer thread: walk sub.new() over HTTP, put record dicts on q.
+    Gives up as soon as the writer sets *stop* (it failed or finished),
+    so a full queue nobody drains never blocks the thread for good.
+    """
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
 
+    try:
         for post in sub.new(limit=None):
             if dt.datetime.utcfromtimestamp(post.created_utc).year < MIN_YEAR:
-                continue
-            buff.append(submission_to_dict(post))
+                break        # new() is newest-first: the rest are older
+            rec      = submission_to_dict(post)
+            comments = []
+            rec["morecomments_dropped"] = None     # None = not fetched
+
+            if post.num_comments <= MAX_THREAD:
+                try:
+                    # limit=0: drop "load more" stubs instead of one
+                    # extra API call per stub – count what we skipped
+                    dropped  = post.comments.replace_more(limit=0)
+                    comments = post.comments.list()
+                    rec["morecomments_dropped"] = sum(m.count for m in dropped)
+                except prawcore.exceptions.PrawcoreException:
+                    pass     # ignore comment-level hiccups
+
+            if not put(rec):
+                return
+            for c in comments:
+                if not put(comment_to_dict(c)):
+                    return
+    except Exception as e:   # re-raised by the writer in scrape_sub
+        put(e)
+        return
+    put(_DONE)
 
-            try:
-                post.comments.replace_more(limit=None)
-                buff.extend(comment_to_dict(c) for c in post.comments.list())
-            except prawcore.exceptions.PrawcoreException:
-                pass         # ignore comment-level hiccups
-
-        if buff:
-            dump(outfile, buff)
-            print(f"[OK ] {name:25} {ARROW} {len(buff):6,d} objs")
+# ── scrape one sub ───────────────────────────────────────────
+def scrape_sub(reddit, name):
+    outfile = RAW_DIR / f"r_{name}.jsonl.zst"
+    if outfile.exists() or outfile.with_suffix(".gz").exists():   # or legacy gzip
+        return True
+    partial = outfile.with_name(outfile.name + ".part")   # renamed when complete
+
+    try:
+        sub = reddit.subreddit(name)
+        n   = 0
+
+        # HTTP in a producer thread, compression + disk here – they overlap
+        q    = queue.Queue(maxsize=1024)
+        stop = threading.Event()
+        threading.Thread(target=fetch_records, args=(sub, q, stop),
+                         daemon=True).start()
+
+        try:
+            with open_zst(partial, "wb") as gz:
+                while (obj := q.get()) is not _DONE:
+                    if isinstance(obj, Exception):
+                        raise obj
+                    dump(gz, obj)
+                    n += 1
+        finally:
+            stop.set()       # writer is done – release the producer
+
+        if n:
+            partial.replace(outfile)
+            print(f"[OK ] {name:25} {ARROW} {n:6,d} objs")
         else:
+            partial.unlink()
             print(f"[WARN] {name:25} {ARROW} no data")
         return True
 
@@ -89,18 +146,35 @@ def scrape_sub(reddit, name):
     return False
 
 # ── main loop ────────────────────────────────────────────────
-def main():
-    reddit = praw.Reddit(
+def pooled_session(size=16):
+    """requests.Session with keep-alive pool (no TLS handshake per call)."""
+    sess    = requests.Session()
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    sess.mount("https://", adapter)
+    return sess
+
+_reddit = None          # one PRAW session per worker process
+
+def init_worker():
+    global _reddit
+    _reddit = praw.Reddit(
         client_id=CLIENT_ID, client_secret=CLIENT_SECRET,
-        user_agent=USER_AGENT, ratelimit_seconds=BIG_SLEEP
+        user_agent=USER_AGENT, ratelimit_seconds=BIG_SLEEP,
+        requestor_kwargs={"session": pooled_session()},
     )
 
+def scrape_one(name):
+    ok = scrape_sub(_reddit, name)
+    time.sleep(1.2)
+    return ok
+
+def main():
     subs = [s.strip() for s in SUB_LIST.read_text().splitlines() if s.strip()]
-    print(f"[INFO] {len(subs)} subreddits to scrape.\n")
+    print(f"[INFO] {len(subs)} subreddits to scrape with {WORKERS} workers.\n")
 
-    for s in subs:
-        scrape_sub(reddit, s)
-        time.sleep(1.2)
+    with ProcessPoolExecutor(max_workers=WORKERS, initializer=init_worker) as ex:
+        for _ in ex.map(scrape_one, subs):
+            pass
 
 if __name__ == "__main__":
     main()
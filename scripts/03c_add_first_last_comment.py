@@ -7,96 +7,180 @@
 #
 # Usage:  python scripts/03c_add_first_last_comment.py
 # -------------------------------------------------------------------
-import asyncio, aiohttp, gzip, json, math, pathlib, time
+import asyncio, aiohttp, math, pathlib, random, time
+import orjson
+from aiolimiter import AsyncLimiter
 from textwrap import dedent
 from tqdm import tqdm
 
-RAW_DIR  = pathlib.Path("data/raw")        # input dumps r_*.jsonl.gz
+from dump_io import open_dump, open_zst, list_dumps, dump_stem
+from http_retry import retry_after_s
+
+RAW_DIR  = pathlib.Path("data/raw")        # input dumps r_*.jsonl.{zst,gz}
 OUT_DIR  = pathlib.Path("data/raw_fc")     # enriched dumps (“fc” = first comment)
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 BATCH_SIZE   = 200       # Pushshift limit per request
-CONCURRENCY  = 8         # simultaneous HTTP sessions
+CONCURRENCY  = 8         # requests in flight, across *all* files
+RATE_LIMIT   = 100       # requests per RATE_PERIOD s (token bucket)
+RATE_PERIOD  = 60
+MAX_TRIES    = 7         # per request; then the batch is left without times
+PAGE_SIZE    = 1000      # comments asked for per search response
+MAX_SPLITS   = 2         # bisection depth per batch (≤ 15 requests)
 PUSH_URL     = (
     "https://api.pushshift.io/reddit/comment/search"
-    "?link_id={ids}&sort={dir}&sort_type=created_utc&size=1"
+    "?link_id={ids}&fields=link_id,created_utc&size={size}{sort}&metadata=true"
 )
 
+# largest page the server has actually returned so far – Pushshift has
+# capped `size` below PAGE_SIZE (100, 500 …) without saying so
+served_max = 0
+
 # ────────────────────────────────────────────────────────────────────
-async def fetch_comment_times(session, ids, *, direction):
+async def push_search(session, ids, *, size, sort="", sem, limiter):
+    """One comment-search call; the parsed response, or None after MAX_TRIES."""
+    url = PUSH_URL.format(ids=",".join(f"t3_{i}" for i in ids),
+                          size=size, sort=sort)
+    for attempt in range(MAX_TRIES):
+        try:
+            async with limiter, sem, session.get(url, timeout=40,
+                                                 raise_for_status=True) as r:
+                body = orjson.loads(await r.read())
+                if not isinstance(body, dict):
+                    raise ValueError("response is not a JSON object")
+                return body
+        except (aiohttp.ClientError, asyncio.TimeoutError,
+                ValueError) as err:                    # incl. a 200 with a broken body
+            retry_after = 0.0
+            if isinstance(err, aiohttp.ClientResponseError):
+                if err.status != 429 and err.status < 500:
+                    break                              # 4xx won't fix itself
+                retry_after = retry_after_s(err.headers)
+            if attempt + 1 == MAX_TRIES:
+                break
+            # jittered exponential back-off, never shorter than Retry-After
+            await asyncio.sleep(max(retry_after,
+                                    min(60, 2 ** attempt + random.random())))
+    print(f"[WARN] giving up on {len(ids)} posts")
+    return None
+
+def page_is_full(resp: dict, n: int) -> bool:
     """
-    direction='asc'  -> first comment
-    direction='desc' -> last  comment
-    Returns {post_id : created_utc}
+    True if the page may have left comments out.  Trust the server's
+    total_results when it reports one; otherwise a page is full once it
+    is as long as the largest page served so far (the effective cap).
     """
-    url = PUSH_URL.format(ids=",".join(f"t3_{i}" for i in ids), dir=direction)
-    backoff = 2
-    while True:
-        try:
-            async with session.get(url, timeout=40) as r:
-                if r.status != 200:
-                    raise RuntimeError(r.status)
-                data = await r.json()
-                return {c["link_id"][3:]: c["created_utc"]
-                        for c in data.get("data", [])}
-        except Exception:
-            await asyncio.sleep(backoff)
-            backoff = min(backoff * 2, 60)
+    global served_max
+    served_max = max(served_max, n)
+    total = (resp.get("metadata") or {}).get("total_results")
+    if isinstance(total, int):
+        return n < total
+    return n > 0 and n >= min(PAGE_SIZE, served_max)
+
+async def fetch_comment_span(session, ids, *, sem, limiter, depth=0):
+    """
+    Returns {post_id : (first_comment_utc, last_comment_utc)}
+    One call per batch: every comment's (link_id, created_utc), min/max
+    taken locally.  Only if a page comes back full is the batch split,
+    at most MAX_SPLITS times; a single huge thread or a batch still
+    truncated after that is asked for its oldest and newest page.
+    """
+    kw   = dict(sem=sem, limiter=limiter)
+    resp = await push_search(session, ids, size=PAGE_SIZE, **kw)
+    if resp is None:
+        return {}
+    data = resp.get("data", [])
+
+    if not page_is_full(resp, len(data)):      # complete – no comment missing
+        span = {}
+        for c in data:
+            pid, t = c["link_id"][3:], c["created_utc"]
+            lo, hi = span.get(pid, (t, t))
+            span[pid] = (min(lo, t), max(hi, t))
+        return span
+
+    if len(ids) > 1 and depth < MAX_SPLITS:    # truncated – bisect the batch
+        mid = len(ids) // 2
+        left, right = await asyncio.gather(
+            fetch_comment_span(session, ids[:mid], depth=depth + 1, **kw),
+            fetch_comment_span(session, ids[mid:], depth=depth + 1, **kw))
+        return {**left, **right}
+
+    # a single huge thread, or still truncated at MAX_SPLITS: the oldest /
+    # newest page – a post that shows up in it has its exact first / last
+    size  = 1 if len(ids) == 1 else PAGE_SIZE
+    first = await push_search(session, ids, size=size,
+                              sort="&sort=asc&sort_type=created_utc", **kw)
+    last  = await push_search(session, ids, size=size,
+                              sort="&sort=desc&sort_type=created_utc", **kw)
+    lo, hi = {}, {}
+    for c in reversed((first or {}).get("data", [])):   # keep the earliest
+        lo[c["link_id"][3:]] = c["created_utc"]
+    for c in reversed((last or {}).get("data", [])):    # keep the latest
+        hi[c["link_id"][3:]] = c["created_utc"]
+    return {pid: (lo.get(pid), hi.get(pid)) for pid in lo.keys() | hi.keys()}
 
 # ────────────────────────────────────────────────────────────────────
-async def enrich_file(fp: pathlib.Path):
-    out_fp = OUT_DIR / fp.name
-    if out_fp.exists():
-        print(f"✓ {fp.stem:25} already enriched")
+async def enrich_file(fp: pathlib.Path, sess: aiohttp.ClientSession,
+                      sem: asyncio.Semaphore, limiter: AsyncLimiter):
+    stem   = dump_stem(fp)
+    out_fp = OUT_DIR / f"{stem}.jsonl.zst"
+    if out_fp.exists() or out_fp.with_suffix(".gz").exists():   # or legacy gzip
+        print(f"✓ {stem:25} already enriched")
         return
 
     # 1️⃣  load all submissions (light-weight, comments stripped)
     subs = []
-    with gzip.open(fp, "rt", encoding="utf-8") as fh:
+    with open_dump(fp, "rb") as fh:
         for line in fh:
-            rec = json.loads(line)
+            rec = orjson.loads(line)
             if rec.get("is_post", True):      # older dumps may miss the flag
                 subs.append(rec)
 
     batches = [subs[i:i+BATCH_SIZE] for i in range(0, len(subs), BATCH_SIZE)]
 
-    # 2️⃣  async Pushshift look-ups
-    async with aiohttp.ClientSession() as sess:
-        sem   = asyncio.Semaphore(CONCURRENCY)
-
-        async def _job(batch):
-            ids = [s["id"] for s in batch]
-            async with sem:
-                first = await fetch_comment_times(sess, ids, direction="asc")
-                last  = await fetch_comment_times(sess, ids, direction="desc")
-                for sub in batch:
-                    pid = sub["id"]
-                    sub["first_comment_utc"] = first.get(pid)   # ⟨None⟩ if absent
-                    sub["last_comment_utc"]  = last.get(pid)
-
-        tasks = [_job(batch) for batch in batches]
-
-        # single progress-bar 👇
-        for coro in tqdm(asyncio.as_completed(tasks),
-                         total=len(tasks),
-                         desc=fp.stem,
-                         ncols=80):
-            await coro
-
-    # 3️⃣  write gzip
-    with gzip.open(out_fp, "wt", encoding="utf-8") as out:
+    # 2️⃣  async Pushshift look-ups (session, semaphore + limiter from amain)
+    async def _job(batch, sess):
+        ids  = [s["id"] for s in batch]
+        span = await fetch_comment_span(sess, ids, sem=sem, limiter=limiter)
+        for sub in batch:
+            # ⟨None⟩ if the post has no comments (or the lookup failed)
+            sub["first_comment_utc"], sub["last_comment_utc"] = \
+                span.get(sub["id"], (None, None))
+
+    tasks = [_job(batch, sess) for batch in batches]
+
+    # single progress-bar 👇
+    for coro in tqdm(asyncio.as_completed(tasks),
+                     total=len(tasks),
+                     desc=stem,
+                     ncols=80):
+        await coro
+
+    # 3️⃣  write zstd
+    with open_zst(out_fp, "wb") as out:
         for rec in subs:
-            out.write(json.dumps(rec) + "\n")
+            out.write(orjson.dumps(rec) + b"\n")
 
-    print(f"→ {fp.stem:25}  {len(subs):7,d} posts enriched")
+    print(f"→ {stem:25}  {len(subs):7,d} posts enriched")
 
 # ────────────────────────────────────────────────────────────────────
 async def amain():
-    files = sorted(RAW_DIR.glob("r_*.jsonl.gz"))
+    files = list_dumps(RAW_DIR, prefix="r_")
     if not files:
         print("No raw dumps found in data/raw/")
         return
-    await asyncio.gather(*(enrich_file(f) for f in files))
+    # one connection pool for every file – no per-file TCP/TLS setup
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY,
+                                     limit_per_host=CONCURRENCY,
+                                     ttl_dns_cache=300)
+    # one concurrency cap + token bucket shared by every file's jobs
+    sem     = asyncio.Semaphore(CONCURRENCY)
+    limiter = AsyncLimiter(RATE_LIMIT, RATE_PERIOD)
+    async with aiohttp.ClientSession(connector=connector,
+                                     headers={"Accept-Encoding": "gzip, deflate"},
+                                     auto_decompress=True) as sess:
+        await asyncio.gather(*(enrich_file(f, sess, sem, limiter) for f in files))
 
 def main():
     asyncio.run(amain())
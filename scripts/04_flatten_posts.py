@@ -2,74 +2,134 @@
 # ────────────────────────────────────────────────────────────────────
 # 04b_reflatten_with_parent.py
 # -------------------------------------------------------------------
-# Re-flatten every raw *.jsonl / *.jsonl.gz (one Reddit submission per
-# line, with nested comments) into a single CSV suitable for latency
-# analysis.  Ensures both post_id and parent_id are present.
+# Re-flatten every raw *.jsonl / .jsonl.gz / .jsonl.zst (one submission per
+# line, with nested comments) into a single zstd Parquet file suitable
+# for latency analysis.  Ensures both post_id and parent_id are present.
 # -------------------------------------------------------------------
-import json, gzip, csv, glob, pathlib
+import os, pathlib
+from concurrent.futures import ProcessPoolExecutor
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
 
-RAW_GLOB   = "data/raw/*.jsonl*"          # ← matches .jsonl and .jsonl.gz
-OUT_CSV    = "data/flat/all_posts_comments.csv"
+from dump_io import open_dump, list_dumps, dump_stem
 
-FIELDNAMES = [
-    "subreddit", "post_id", "comment_id", "parent_id", "is_post",
-    "author", "created_utc", "score", "num_comments", "body"
-]
+RAW_DIR    = "data/raw"                   # .jsonl, .jsonl.gz and .jsonl.zst
+OUT_PQ     = "data/flat/all_posts_comments.parquet"
+PART_DIR   = pathlib.Path("data/flat/parts")   # one Parquet part per dump
+FLUSH_ROWS = 100_000                           # rows per row group
+
+DICT_STR = pa.dictionary(pa.int32(), pa.string())   # low-cardinality text
+SCHEMA = pa.schema([
+    ("subreddit",    DICT_STR),
+    ("post_id",      pa.string()),
+    ("comment_id",   pa.string()),
+    ("parent_id",    pa.string()),
+    ("is_post",      pa.int8()),
+    ("author",       DICT_STR),
+    ("created_utc",  pa.int64()),
+    ("score",        pa.int64()),
+    ("num_comments", pa.int64()),
+    ("body",         pa.string()),
+])
+FIELDNAMES = SCHEMA.names
+
+# newline / CR / tab → space in one C-level pass
+_TBL = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
+
+class ColumnSink:
+    """One Python list per column; flushed as a row group every FLUSH_ROWS."""
+
+    def __init__(self, path):
+        self.cols   = {k: [] for k in FIELDNAMES}
+        self.writer = pq.ParquetWriter(path, SCHEMA, compression="zstd")
+
+    def __len__(self):
+        return len(self.cols["post_id"])
+
+    def flush(self):
+        if len(self):
+            self.writer.write_table(pa.Table.from_pydict(self.cols, schema=SCHEMA))
+            for v in self.cols.values():
+                v.clear()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
 
 # ─── helpers ───────────────────────────────────────────────────────
-def flatten_one_thread(rec: dict, writer):
-    """Write one submission plus every comment/reply to writer."""
+def flatten_one_thread(rec: dict, sink: ColumnSink):
+    """Append one submission plus every comment/reply to sink's columns."""
     sub  = rec["subreddit"]
     pid  = rec["id"]                     # submission ID
+    cols = sink.cols
+    subreddit, post_id, comment_id, parent_id, is_post = (
+        cols["subreddit"], cols["post_id"], cols["comment_id"],
+        cols["parent_id"], cols["is_post"])
+    author, created_utc, score, num_comments, body = (
+        cols["author"], cols["created_utc"], cols["score"],
+        cols["num_comments"], cols["body"])
+
     # ---------- submission row -------------------------------------
-    writer.writerow({
-        "subreddit":    sub,
-        "post_id":      pid,
-        "comment_id":   "",              # none – this *is* the post
-        "parent_id":    f"t3_{pid}",     # canonical self-parent
-        "is_post":      1,
-        "author":       rec.get("author", "[deleted]"),
-        "created_utc":  rec["created_utc"],
-        "score":        rec.get("score", 0),
-        "num_comments": rec.get("num_comments", 0),
-        "body":         rec.get("selftext", "").replace("\n", " ").strip(),
-    })
+    subreddit.append(sub)
+    post_id.append(pid)
+    comment_id.append("")                # none – this *is* the post
+    parent_id.append(f"t3_{pid}")        # canonical self-parent
+    is_post.append(1)
+    author.append(rec.get("author", "[deleted]"))
+    created_utc.append(int(rec["created_utc"]))
+    score.append(rec.get("score", 0))
+    num_comments.append(rec.get("num_comments", 0))
+    body.append((rec.get("selftext", "") or "").translate(_TBL).strip())
 
     # ---------- depth-first over comment tree ----------------------
     stack = rec.get("comments", [])
     while stack:
         c = stack.pop()
-        writer.writerow({
-            "subreddit":    sub,
-            "post_id":      pid,
-            "comment_id":   c["id"],
-            "parent_id":    c.get("parent_id", ""),
-            "is_post":      0,
-            "author":       c.get("author", "[deleted]"),
-            "created_utc":  c["created_utc"],
-            "score":        c.get("score", 0),
-            "num_comments": 0,
-            "body":         c.get("body", "").replace("\n", " ").strip(),
-        })
+        subreddit.append(sub)
+        post_id.append(pid)
+        comment_id.append(c["id"])
+        parent_id.append(c.get("parent_id", ""))
+        is_post.append(0)
+        author.append(c.get("author", "[deleted]"))
+        created_utc.append(int(c["created_utc"]))
+        score.append(c.get("score", 0))
+        num_comments.append(0)
+        body.append((c.get("body", "") or "").translate(_TBL).strip())
         stack.extend(c.get("replies", []))   # push replies onto stack
 
+    if len(sink) >= FLUSH_ROWS:
+        sink.flush()
+
+# ─── per-file worker ───────────────────────────────────────────────
+def flatten_file(fp: pathlib.Path) -> pathlib.Path:
+    """Flatten one dump into its own part file (no shared writer)."""
+    part = PART_DIR / f"part_{dump_stem(fp)}.parquet"
+    sink = ColumnSink(part)
+    with open_dump(fp, "rb") as jf:
+        for line in jf:
+            flatten_one_thread(orjson.loads(line), sink)
+    sink.close()
+    return part
+
 # ─── main ──────────────────────────────────────────────────────────
 def main():
-    pathlib.Path("data/flat").mkdir(parents=True, exist_ok=True)
+    PART_DIR.mkdir(parents=True, exist_ok=True)
 
-    with open(OUT_CSV, "w", newline="", encoding="utf-8") as fh:
-        w = csv.DictWriter(fh, fieldnames=FIELDNAMES)
-        w.writeheader()
+    files = list_dumps(RAW_DIR)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        # map() yields in input order → same row order as a serial run
+        parts = list(tqdm(ex.map(flatten_file, files), total=len(files),
+                          desc="flattening", unit="file"))
 
-        files = sorted(glob.glob(RAW_GLOB))
-        for fp in tqdm(files, desc="flattening", unit="file"):
-            opener = gzip.open if fp.endswith(".gz") else open
-            with opener(fp, "rt", encoding="utf-8") as jf:
-                for line in jf:
-                    flatten_one_thread(json.loads(line), w)
+    with pq.ParquetWriter(OUT_PQ, SCHEMA, compression="zstd") as out:
+        for part in parts:
+            for batch in pq.ParquetFile(part).iter_batches():
+                out.write_batch(batch)
+            part.unlink()
 
-    print(f"[DONE] wrote → {OUT_CSV}")
+    print(f"[DONE] wrote → {OUT_PQ}")
 
 if __name__ == "__main__":
     main()
@@ -3,7 +3,7 @@
 """
 scripts/04_preprocess.py
 ————————————————————————————————————————————
-• load raw *.jsonl from data/raw/
+• load raw *.jsonl / .jsonl.gz / .jsonl.zst from data/raw/
 • basic text hygiene   (lower-case, de-emoji, strip urls)
 • compute engagement = score + log(comments+1) + 2*awards
 • compute latency     = minutes to first comment  (NaN if none)
@@ -11,86 +11,96 @@ scripts/04_preprocess.py
 • save   → data/clean/<sub>.parquet      (pyarrow backend)
 """
 
-import os, json, re, pathlib, datetime as dt, math, typing as T
+import os, re, pathlib, datetime as dt, typing as T
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import orjson
 import pandas as pd
 from tqdm import tqdm
 
+from dump_io import open_dump, list_dumps, dump_stem
+
 RAW_DIR   = pathlib.Path("data/raw")
 CLEAN_DIR = pathlib.Path("data/clean")
 MIN_DATE  = dt.datetime(2015, 1, 1, tzinfo=dt.timezone.utc)
+MIN_TS    = MIN_DATE.timestamp()
 
-url_re   = re.compile(r"https?://\S+")
-emoji_re = re.compile(
-    "["                       # remove most emojis – keeps ♀ ♂ etc.
+# url | emoji run | whitespace, collapsed to one space in a single pass
+CLEAN_RE = re.compile(
+    r"(?:https?://\S+"
+    "|["                      # remove most emojis – keeps ♀ ♂ etc.
     "\U0001F600-\U0001F64F"
     "\U0001F300-\U0001F5FF"
     "\U0001F680-\U0001F6FF"
     "\U0001F1E0-\U0001F1FF"
-    "]+",
-    flags=re.UNICODE,
+    r"]|\s)+"
 )
 
 def clean(text: str) -> str:
-    text = url_re.sub(" ", text or "")
-    text = emoji_re.sub(" ", text)
-    text = re.sub(r"\s+", " ", text.lower()).strip()
-    return text
-
-def enrich(row: dict) -> dict:
-    """Add engagement + latency; drop if outside date window."""
-    created = dt.datetime.fromtimestamp(
-        row["created_utc"], tz=dt.timezone.utc
-    )
-    if created < MIN_DATE:
-        return None
-
-    body = f'{row.get("title","")} {row.get("selftext","")}'
-    body = clean(body)
-    if len(body) < 20 or row.get("author") in {"[deleted]", None}:
-        return None
-
-    row["clean_text"] = body
-    row["engagement"] = (
-        row.get("score", 0)
-        + math.log(row.get("num_comments", 0) + 1)
-        + 2 * row.get("total_awards", 0)
-    )
+    return CLEAN_RE.sub(" ", text).lower().strip()
+
+def text_col(df: pd.DataFrame, name: str) -> pd.Series:
+    """String column with missing values (or a missing column) as ''."""
+    if name not in df:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[name].fillna("").astype(str)
+
+def num_col(df: pd.DataFrame, name: str) -> T.Union[pd.Series, int]:
+    return df[name].fillna(0) if name in df else 0
 
-    first_reply_ts = row.get("first_comment_utc")
-    row["latency_min"] = (
-        (first_reply_ts - row["created_utc"]) / 60
-        if first_reply_ts
+def enrich(df: pd.DataFrame) -> pd.DataFrame:
+    """Add engagement + latency; drop rows outside the date window."""
+    df = df[df["created_utc"] >= MIN_TS]
+
+    body   = (text_col(df, "title") + " " + text_col(df, "selftext")).map(clean)
+    author = df["author"] if "author" in df else pd.Series(None, index=df.index)
+    keep   = (body.str.len() >= 20) & author.notna() & (author != "[deleted]")
+    df, body = df[keep], body[keep]
+
+    df = df.assign(
+        clean_text=body,
+        engagement=(num_col(df, "score")
+                    + np.log1p(num_col(df, "num_comments"))
+                    + 2 * num_col(df, "total_awards")),
+    )
+    first = df["first_comment_utc"] if "first_comment_utc" in df else None
+    df["latency_min"] = (
+        ((first - df["created_utc"]) / 60).where(first > 0)
+        if first is not None
         else None
     )
-    return row
+    return df
 
 def process_file(path: pathlib.Path) -> None:
-    out_pq = CLEAN_DIR / (path.stem + ".parquet")
+    stem   = dump_stem(path)
+    out_pq = CLEAN_DIR / (stem + ".parquet")
     if out_pq.exists():
-        print(f"✓ {path.stem:25}  already done")
+        print(f"✓ {stem:25}  already done")
         return
 
-    records: list[dict] = []
-    with path.open(encoding="utf-8") as f:
-        for line in f:
-            raw = json.loads(line)
-            ok = enrich(raw)
-            if ok:
-                records.append(ok)
+    with open_dump(path, "rb") as fh:
+        records = [orjson.loads(line) for line in fh]
+    df = pd.DataFrame.from_records(records)
+    df = enrich(df) if "created_utc" in df else df.iloc[0:0]
 
-    if not records:
-        print(f"⚠ {path.stem:25}  nothing kept")
+    if df.empty:
+        print(f"⚠ {stem:25}  nothing kept")
         return
 
-    df = pd.DataFrame.from_records(records)
-    df.to_parquet(out_pq, index=False)
-    print(f"→ {path.stem:25}  {len(df):5,d} rows")
+    # output schema from the kept records alone: comment-only fields don't
+    # leak in as all-null columns, all-digit ids stay str, ints stay int
+    out = pd.DataFrame.from_records([records[i] for i in df.index])
+    for col in ("clean_text", "engagement", "latency_min"):
+        out[col] = df[col].to_numpy()
+    out.to_parquet(out_pq, index=False)
+    print(f"→ {stem:25}  {len(df):5,d} rows")
 
 def main() -> None:
     CLEAN_DIR.mkdir(exist_ok=True, parents=True)
-    files = sorted(RAW_DIR.glob("*.jsonl"))
-    for p in tqdm(files, unit="sub"):
-        process_file(p)
+    files = list_dumps(RAW_DIR)
+    # files are independent – one sub per worker
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        list(tqdm(ex.map(process_file, files), total=len(files), unit="sub"))
 
 if __name__ == "__main__":
     main()
@@ -1,22 +1,59 @@
 #!/usr/bin/env python3
 # 04b_reflatten_with_parent.py
 # ------------------------------------------------------------------
-# Re-flatten every raw *.jsonl (one post+thread per line) into one CSV
+# Re-flatten every raw *.jsonl (one post+thread per line) into one Parquet
 # with both post_id *and* parent_id filled so we can measure reply latency.
 # ------------------------------------------------------------------
 
-import json, gzip, csv, glob, os, pathlib
+import os, pathlib
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
 
+from dump_io import open_dump, list_dumps
+
 # adjust these paths if needed
-RAW_DIR    = "data/raw/*.jsonl*"           # raw dumps (jsonl or jsonl.gz)
-OUT_CSV    = "data/flat/all_posts_comments.csv"
-FIELDNAMES = [
-    "subreddit", "post_id", "comment_id", "parent_id", "is_post",
-    "author",    "created_utc", "score",      "num_comments", "body"
-]
-
-def flatten_one_thread(rec: dict, writer: csv.DictWriter):
+RAW_DIR    = "data/raw"                    # raw dumps (jsonl, .gz or .zst)
+OUT_PQ     = "data/flat/all_posts_comments.parquet"
+CHUNK_ROWS = 65_536                        # rows per Parquet row group
+DICT_STR   = pa.dictionary(pa.int32(), pa.string())
+_TBL       = str.maketrans({"\n": " ", "\r": " ", "\t": " "})   # one pass
+SCHEMA = pa.schema([
+    ("subreddit",    DICT_STR),
+    ("post_id",      pa.string()),
+    ("comment_id",   pa.string()),
+    ("parent_id",    pa.string()),
+    ("is_post",      pa.int8()),
+    ("author",       DICT_STR),
+    ("created_utc",  pa.int64()),
+    ("score",        pa.int64()),
+    ("num_comments", pa.int64()),
+    ("body",         pa.string()),
+])
+
+class ParquetRows:
+    """writerow()-compatible sink: buffers dicts, writes CHUNK_ROWS at a time."""
+
+    def __init__(self, path):
+        self.rows   = []
+        self.writer = pq.ParquetWriter(path, SCHEMA, compression="zstd")
+
+    def writerow(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(pa.Table.from_pylist(self.rows, schema=SCHEMA))
+            self.rows.clear()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def flatten_one_thread(rec: dict, writer: ParquetRows):
     """Emit one row for the post and one for each nested comment."""
     sub   = rec["subreddit"]
     pid   = rec["id"]
@@ -28,11 +65,10 @@ def flatten_one_thread(rec: dict, writer: csv.DictWriter):
         "parent_id":    f"t3_{pid}",
         "is_post":      1,
         "author":       rec.get("author","[deleted]"),
-        "created_utc":  rec["created_utc"],
+        "created_utc":  int(rec["created_utc"]),
         "score":        rec.get("score",0),
         "num_comments": rec.get("num_comments",0),
-        "body":         rec.get("selftext",""
-                                ).replace("\n"," ").strip(),
+        "body":         (rec.get("selftext","") or "").translate(_TBL).strip(),
     })
 
     # depth-first walk of comments
@@ -47,11 +83,10 @@ def flatten_one_thread(rec: dict, writer: csv.DictWriter):
             "parent_id":    c.get("parent_id", ""),
             "is_post":      0,
             "author":       c.get("author","[deleted]"),
-            "created_utc":  c["created_utc"],
+            "created_utc":  int(c["created_utc"]),
             "score":        c.get("score",0),
             "num_comments": 0,
-            "body":         c.get("body",""
-                                    ).replace("\n"," ").strip(),
+            "body":         (c.get("body","") or "").translate(_TBL).strip(),
         })
         # push any replies onto the stack
         stack.extend(c.get("replies", []))
@@ -59,21 +94,18 @@ def flatten_one_thread(rec: dict, writer: csv.DictWriter):
 
 def main():
     # ensure output folder exists
-    pathlib.Path(os.path.dirname(OUT_CSV)).mkdir(parents=True, exist_ok=True)
-
-    with open(OUT_CSV, "w", encoding="utf-8", newline="") as fh:
-        writer = csv.DictWriter(fh, fieldnames=FIELDNAMES)
-        writer.writeheader()
+    pathlib.Path(os.path.dirname(OUT_PQ)).mkdir(parents=True, exist_ok=True)
 
-        files = sorted(glob.glob(RAW_DIR))
-        for fp in tqdm(files, desc="flattening raw threads", unit="file"):
-            opener = gzip.open if fp.endswith(".gz") else open
-            with opener(fp, "rt", encoding="utf-8") as jf:
-                for line in jf:
-                    rec = json.loads(line)
-                    flatten_one_thread(rec, writer)
+    writer = ParquetRows(OUT_PQ)
+    files  = list_dumps(RAW_DIR)
+    for fp in tqdm(files, desc="flattening raw threads", unit="file"):
+        with open_dump(fp, "rb") as jf:
+            for line in jf:
+                rec = orjson.loads(line)
+                flatten_one_thread(rec, writer)
+    writer.close()
 
-    print(f"[DONE] wrote → {OUT_CSV}")
+    print(f"[DONE] wrote → {OUT_PQ}")
 
 
 if __name__ == "__main__":
@@ -16,11 +16,18 @@ Select “high–signal” Reddit posts per subreddit.
 from __future__ import annotations
 
 import argparse
-import math
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# only these are needed to rank posts – body etc. is fetched for the winners
+RANK_COLS = ["subreddit", "author", "score", "num_comments", "total_awards"]
+RANK_DTYPES = {"score": "Int32", "num_comments": "Int32", "total_awards": "Int32",
+               "author": "category", "subreddit": "category"}
+CHUNK_ROWS = 200_000
 
 
 # --------------------------------------------------------------------------- #
@@ -44,16 +51,59 @@ def engagement_score(df: pd.DataFrame) -> pd.Series:
     return s + np.log1p(c) + 2 * a
 
 
-def pick_top_pct(group: pd.DataFrame, *, pct: float, cap: int) -> pd.DataFrame:
+def strip_blank_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop stray blank-name columns (there is one just after “subreddit”)."""
+    df = df.loc[:, df.columns.str.strip().astype(bool)]
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def load_columns(path: Path, cols: list[str]) -> pd.DataFrame:
     """
-    Return the `pct`-percent most-engaged rows of *group*, capped at *cap* rows.
+    Read only *cols* (those present) from a Parquet or CSV file.
+    The index is the row position in the file.
     """
-    if group.empty:
-        return group
+    if path.suffix == ".parquet":
+        have = set(pq.ParquetFile(path).schema_arrow.names)
+        return pd.read_parquet(path, columns=[c for c in cols if c in have])
+    df = pd.read_csv(path, usecols=lambda c: c.strip() in cols, dtype=RANK_DTYPES)
+    return strip_blank_columns(df)
+
 
-    n_keep = max(1, math.ceil(len(group) * pct / 100))
-    n_keep = min(n_keep, cap)
-    return group.nlargest(n_keep, "engagement")
+def load_rows(path: Path, positions: pd.Index) -> pd.DataFrame:
+    """
+    Every column, but only for the rows at *positions*.  Read chunk by
+    chunk so the full body column is never held in memory at once.
+    """
+    wanted = np.sort(positions.to_numpy())
+    parts = []
+    if path.suffix == ".parquet":
+        start = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=CHUNK_ROWS):
+            stop = start + batch.num_rows
+            lo, hi = np.searchsorted(wanted, [start, stop])
+            if hi > lo:
+                part = batch.take(pa.array(wanted[lo:hi] - start)).to_pandas()
+                part.index = wanted[lo:hi]
+                parts.append(part)
+            start = stop
+    else:
+        # chunks keep counting the RangeIndex, so it is the row position
+        for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS):
+            parts.append(chunk[chunk.index.isin(wanted)])
+    return strip_blank_columns(pd.concat(parts))
+
+
+def top_pct_mask(df: pd.DataFrame, *, pct: float, cap: int) -> pd.Series:
+    """
+    True for the `pct`-percent most-engaged rows of every subreddit,
+    capped at *cap* rows per subreddit (ties: first row wins).
+    """
+    g = df.groupby("subreddit", observed=True)["engagement"]
+    sizes = g.transform("size")
+    n_keep = np.minimum(np.maximum(1, np.ceil(sizes * pct / 100)), cap)
+    rank = g.rank(method="first", ascending=False)
+    return rank <= n_keep
 
 
 # --------------------------------------------------------------------------- #
@@ -64,8 +114,8 @@ def main() -> None:
         description="Select high-signal posts per subreddit",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
-    ap.add_argument("-i", "--in_path", default="data/flat/all_posts_comments.csv",
-                    help="input CSV (plain or .gz)")
+    ap.add_argument("-i", "--in_path", default="data/flat/all_posts_comments.parquet",
+                    help="input Parquet, or CSV (plain or .gz)")
     ap.add_argument("-o", "--out_path",
                     default="data/flat/selected_high_signal_posts.csv",
                     help="output CSV")
@@ -82,16 +132,12 @@ def main() -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     print(f"[LOAD ] {in_path}")
-    df = pd.read_csv(in_path)
-
-    # strip stray blank-name columns (there is one just after “subreddit”)
-    df = df.loc[:, df.columns.str.strip().astype(bool)]
-    df.columns = df.columns.str.strip()
+    df = load_columns(in_path, RANK_COLS)
 
     # remove deleted / removed authors if column exists
     if "author" in df.columns:
         before = len(df)
-        df = df[~df["author"].fillna("").str.lower().isin(
+        df = df[~df["author"].astype("string").fillna("").str.lower().isin(
             ["[deleted]", "[removed]", ""])]
         print(f"[CLEAN] dropped {before - len(df):,} deleted / removed authors")
 
@@ -99,7 +145,7 @@ def main() -> None:
     df["engagement"] = engagement_score(df)
 
     # keep only subreddits with enough posts
-    counts = df.groupby("subreddit").size()
+    counts = df.groupby("subreddit", observed=True).size()
     keep_subs = counts[counts >= args.min_posts].index
     print(f"[TRIM ] keeping {len(keep_subs):4} subs ≥ {args.min_posts} posts;"
           f" dropping {len(counts) - len(keep_subs)}")
@@ -112,11 +158,19 @@ def main() -> None:
 
     # pick high-engagement rows
     top_posts = (
-        posts.groupby("subreddit", group_keys=False)
-        .apply(pick_top_pct, pct=args.top_pct, cap=args.max_per_sub)
+        posts[top_pct_mask(posts, pct=args.top_pct, cap=args.max_per_sub)]
+        .sort_values(["subreddit", "engagement"], ascending=[True, False],
+                     kind="stable")
     )
     print(f"[ENG  ] selected {len(top_posts):,} posts in top {args.top_pct:g} % engagement")
 
+    # second, narrow pass: full rows for the selected positions only
+    top_posts = (
+        load_rows(in_path, top_posts.index)
+        .loc[top_posts.index]
+        .assign(engagement=top_posts["engagement"])
+    )
+
     # ------------------------------------------------------------------ #
     # save
     # ------------------------------------------------------------------ #
@@ -132,7 +186,7 @@ def main() -> None:
     # audit table
     audit_path = out_path.parent / "_audit_high_signal_counts.csv"
     (
-        top_posts.groupby("subreddit")
+        top_posts.groupby("subreddit", observed=True)
         .size()
         .rename("n_posts")
         .reset_index()
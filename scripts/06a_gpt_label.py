@@ -1,9 +1,13 @@
 #!/usr/bin/env python
 # 06a_gpt_label.py   ── label Reddit posts with a single OpenAI model
 # ---------------------------------------------------------------------
-import os, json, time, argparse, textwrap, pandas as pd
+import json, random, asyncio, argparse, pandas as pd
+import openai
 from pathlib import Path
-from tqdm import tqdm
+from tqdm.asyncio import tqdm
+
+from http_retry import retry_after_s
+from label_io import truncate_post
 
 ##############################################################################
 # 0 ── categories & prompt boilerplate                                      ##
@@ -21,10 +25,12 @@ CATEGORIES = {
     "off_topic":         "Material unrelated to health / subreddit focus, spam / ads, or pure jokes."
 }
 LABELS        = list(CATEGORIES.keys())
+CAT_SET       = frozenset(LABELS)     # membership checks on replies
 MAX_CHARS     = 4_000
 N_LABELS      = 5
 TEMPERATURE   = 0.0
-SLEEP_BETWEEN = 0.3          # polite pause between calls
+CONCURRENCY   = 16           # requests in flight
+MAX_TRIES     = 7            # back-off 0.5 s → 1 s → 2 s … (cap 60 s)
 
 LABEL_BLOCK = "\n".join(f"- {l}" for l in LABELS)
 SYSTEM_MSG = (
@@ -35,42 +41,46 @@ SYSTEM_MSG = (
 )
 
 ##############################################################################
-# 1 ── minimal retry decorator (avoid external deps)                         ##
+# 1 ── exponential back-off with jitter, honouring Retry-After               ##
 ##############################################################################
-def retry3(func):
-    def wrapped(*a, **kw):
-        for attempt in range(3):
-            try:
-                return func(*a, **kw)
-            except Exception as e:
-                if attempt == 2:
-                    raise
-                print("WARN", e, "- retrying"); time.sleep(1.5)
-    return wrapped
+RETRYABLE = (openai.RateLimitError, openai.APIConnectionError,
+             openai.InternalServerError)
+
+async def with_backoff(coro_factory):
+    """Await coro_factory() until it succeeds or MAX_TRIES are used up."""
+    for attempt in range(MAX_TRIES):
+        try:
+            return await coro_factory()
+        except RETRYABLE as e:
+            if attempt == MAX_TRIES - 1:
+                raise
+            retry_after = 0.0
+            if isinstance(e, openai.RateLimitError):
+                retry_after = retry_after_s(e.response.headers)   # s or HTTP-date
+            delay = min(60, max(retry_after,
+                                0.5 * 2 ** attempt + random.uniform(0, 0.25)))
+            print(f"WARN {type(e).__name__} - retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
 ##############################################################################
 # 2 ── OpenAI caller                                                        ##
 ##############################################################################
-import openai
-openai.api_key = os.getenv("OPENAI_API_KEY") or ""
+client = openai.AsyncOpenAI(max_retries=0)   # reads OPENAI_API_KEY
 
-@retry3
-# ---- replace lines 55-57 in the previous file with this -------------------
-def gpt_labels(model: str, post_txt: str) -> list[str]:
-    # truncate long posts for cost control
-    snippet = textwrap.shorten(post_txt, MAX_CHARS, placeholder=" (…)")
+async def gpt_labels(model: str, post_txt: str) -> list[str]:
+    snippet = truncate_post(post_txt, MAX_CHARS)
     prompt  = f"POST:\n{snippet}"
-    chat    = openai.chat.completions.create(
+    chat    = await with_backoff(lambda: client.chat.completions.create(
         model=model, temperature=TEMPERATURE,
         messages=[{"role": "system", "content": SYSTEM_MSG},
                   {"role": "user",   "content": prompt}]
-    )
+    ))
 
     raw = chat.choices[0].message.content.strip()
     try:
         data = json.loads(raw)
         if isinstance(data, dict) and isinstance(data.get("labels"), list):
-            return [l for l in data["labels"] if l in LABELS][:N_LABELS]
+            return [l for l in data["labels"] if l in CAT_SET][:N_LABELS]
     except Exception:
         pass
     return ["off_topic"]
@@ -78,22 +88,33 @@ def gpt_labels(model: str, post_txt: str) -> list[str]:
 ##############################################################################
 # 3 ── main workflow                                                        ##
 ##############################################################################
+async def label_all(model: str, bodies) -> list[str]:
+    """Label every body, CONCURRENCY at a time; results keep input order."""
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def _bounded(txt: str) -> str:
+        async with sem:
+            return ";".join(await gpt_labels(model, txt))
+
+    tasks = [asyncio.create_task(_bounded(txt)) for txt in bodies]
+    return await tqdm.gather(*tasks, desc="labelling", unit="post")
+
 def run(input_csv: str, outdir: str, model: str):
-    df = pd.read_csv(input_csv)
-    df["body"] = df["body"].fillna("")
+    # keys + body only – other post columns are never sent or used
+    df = pd.read_csv(input_csv, usecols=["subreddit", "post_id", "body"],
+                     dtype=str, keep_default_na=False)
 
-    labels = []
-    for txt in tqdm(df["body"], desc="labelling", unit="post"):
-        labels.append(";".join(gpt_labels(model, txt)))
-        time.sleep(SLEEP_BETWEEN)
+    # one API call per distinct body (crossposts, automod templates …)
+    unique = df["body"].drop_duplicates()
+    print(f"[INFO] {len(unique):,} unique bodies of {len(df):,} rows")
+    labels_map = dict(zip(unique, asyncio.run(label_all(model, unique))))
 
-    df_out = df.copy()
-    df_out["labels"] = labels
+    df["labels"] = df["body"].map(labels_map)      # df is ours – no copy
 
     out_path = Path(outdir)
     out_path.mkdir(parents=True, exist_ok=True)
-    out_file = out_path / f"labels_{model}.csv"
-    df_out.to_csv(out_file, index=False)
+    out_file = out_path / f"labels_{model}.parquet"
+    df.to_parquet(out_file, index=False, compression="zstd")
     print("[DONE] wrote", out_file)
 
 ##############################################################################
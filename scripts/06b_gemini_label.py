@@ -8,19 +8,27 @@
 #          -o data/flat/model_labels \
 #          -m gemini-1.5-flash
 # -------------------------------------------------------------------
-import os, re, json, time, argparse, textwrap
+import os, asyncio, argparse, functools, hashlib
 from pathlib import Path
 
 import pandas as pd
 import backoff
+import diskcache
+import orjson
 import google.generativeai as genai
-from tqdm import tqdm
+from aiolimiter import AsyncLimiter
+from tqdm.asyncio import tqdm
+
+from label_io import truncate_post, first_json_block
 
 # ─── CONFIG ─────────────────────────────────────────────────────────
-MAX_CHARS = 4_000        # truncate only if post > 4 k chars
-SLEEP     = 0.3          # polite pause between calls
-TEMP      = 0.0          # deterministic output
-N_LABELS  = 3            # keep ≤ 3 labels/post
+MIN_CHARS   = 20         # shorter bodies are never sent
+MAX_CHARS   = 4_000      # truncate only if post > 4 k chars
+CONCURRENCY = 32         # requests in flight
+QPM         = 500        # requests per minute (token bucket)
+TEMP        = 0.0        # deterministic output
+N_LABELS    = 3          # keep ≤ 3 labels/post
+CACHE       = diskcache.Cache("data/cache/gemini")   # labels by (model, prompt)
 
 CATEGORIES = {
     "experience":        "Personal narrative of one's condition, symptoms, or story.",
@@ -35,6 +43,7 @@ CATEGORIES = {
     "off_topic":         "Material unrelated to health / subreddit focus, obvious spam/ads, or pure jokes."
 }
 
+CAT_SET     = frozenset(CATEGORIES)      # membership checks on replies
 LABEL_BLOCK = "\n".join(f"- {lab}" for lab in CATEGORIES)
 SYS_PROMPT = (
     "You are a qualitative health-research assistant.\n"
@@ -49,55 +58,97 @@ if "GOOGLE_API_KEY" not in os.environ:
     raise SystemExit("❌  Set GOOGLE_API_KEY in your environment first.")
 genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
 
-# ─── HELPERS ────────────────────────────────────────────────────────
-json_pat = re.compile(r"\{.*?\}", re.S)   # first {...} block, non-greedy
+limiter = AsyncLimiter(QPM, 60)
 
+# ─── HELPERS ────────────────────────────────────────────────────────
 def build_prompt(text: str) -> str:
-    snippet = text if len(text) <= MAX_CHARS else textwrap.shorten(
-        text, MAX_CHARS, placeholder=" (…)")
+    snippet = truncate_post(text, MAX_CHARS)
     return f"POST:\n{snippet}\n\n{SYS_PROMPT}"
 
-def safe_parse_labels(raw: str) -> list[str]:
-    """Grab the first JSON object in raw text & validate."""
-    m = json_pat.search(raw)
-    if not m:
-        return []
+def safe_parse_labels(raw: str) -> list[str] | None:
+    """
+    Grab the first JSON object in raw text & validate.  None if there is
+    no {"labels": [...]} object or none of its labels is in CATEGORIES.
+    """
+    block = first_json_block(raw)
+    if block is None:
+        return None
     try:
-        obj = json.loads(m.group(0))
-        if isinstance(obj, dict) and isinstance(obj.get("labels"), list):
-            return [l for l in obj["labels"] if l in CATEGORIES]
-    except Exception:
-        pass
-    return []
+        obj = orjson.loads(block)
+    except orjson.JSONDecodeError:
+        return None
+    if not (isinstance(obj, dict) and isinstance(obj.get("labels"), list)):
+        return None
+    labels = [l for l in obj["labels"] if isinstance(l, str) and l in CAT_SET]
+    return labels if labels or not obj["labels"] else None
+
+@functools.lru_cache(maxsize=4)
+def get_model(model_name: str) -> genai.GenerativeModel:
+    """One GenerativeModel per name for the whole run."""
+    return genai.GenerativeModel(model_name)
+
+def cache_key(model_name: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
 
 @backoff.on_exception(backoff.expo, Exception, max_tries=4, factor=2)
-def gemini_labels(model_name: str, post_txt: str) -> list[str]:
-    model = genai.GenerativeModel(model_name)
-    rsp   = model.generate_content(
-        build_prompt(post_txt),
-        generation_config={"temperature": TEMP}
-    )
-    return safe_parse_labels(rsp.text)[:N_LABELS]
+async def gemini_labels(model_name: str, post_txt: str) -> list[str]:
+    prompt = build_prompt(post_txt)
+    key    = cache_key(model_name, prompt)
+    if key in CACHE:                          # crosspost / repost seen before
+        return CACHE[key]
+
+    model = get_model(model_name)
+    async with limiter:                       # every attempt counts towards QPM
+        rsp = await model.generate_content_async(
+            prompt,
+            generation_config={"temperature": TEMP}
+        )
+    labels = safe_parse_labels(rsp.text)
+    if labels is None:                        # unusable reply – retry next run
+        return []
+    labels = labels[:N_LABELS]
+    CACHE[key] = labels
+    return labels
+
+async def label_all(model_name: str, bodies) -> list[str]:
+    """Label every body, CONCURRENCY at a time; results keep input order."""
+    sem  = asyncio.Semaphore(CONCURRENCY)
+    done = 0
+
+    async def _bounded(txt: str) -> str:
+        nonlocal done
+        async with sem:
+            labs = await gemini_labels(model_name, str(txt))
+        done += 1
+        if done % 250 == 0:                     # heartbeat every 250 posts
+            print(f"✓ {done} posts – latest labels: {labs}")
+        return ";".join(labs)
+
+    return await tqdm.gather(*(_bounded(t) for t in bodies),
+                             desc="Labelling", unit="post")
 
 # ─── MAIN ───────────────────────────────────────────────────────────
 def main(input_csv: str, out_dir: str, model_name: str):
-    df = pd.read_csv(input_csv)
-    labels_out = []
+    # keys + body only – other post columns are never sent or used
+    df = pd.read_csv(input_csv, usecols=["subreddit", "post_id", "body"],
+                     dtype=str, keep_default_na=False)
 
-    for idx, txt in enumerate(tqdm(df["body"].fillna(""), desc="Labelling", unit="post")):
-        labs = gemini_labels(model_name, str(txt))
-        labels_out.append(";".join(labs))
-        if (idx + 1) % 250 == 0:                # heartbeat every 250 posts
-            print(f"✓ {idx+1} posts – latest labels: {labs}")
-        time.sleep(SLEEP)
+    # identical bodies share one request
+    unique = df["body"].drop_duplicates()
+    # empty / link-only bodies can't carry a label – don't pay for them
+    short  = unique.str.strip().str.len() < MIN_CHARS
+    print(f"[INFO] {len(unique):,} unique bodies of {len(df):,} rows "
+          f"({short.sum():,} under {MIN_CHARS} chars skipped)")
+    labels_map = dict.fromkeys(unique[short], "")
+    labels_map.update(zip(unique[~short],
+                          asyncio.run(label_all(model_name, unique[~short]))))
 
-    df_out = df.copy()
-    df_out["labels"] = labels_out
+    df["labels"] = df["body"].map(labels_map)      # df is ours – no copy
 
     Path(out_dir).mkdir(parents=True, exist_ok=True)
     safe_name = model_name.replace("/", "_")
-    out_path  = Path(out_dir) / f"labels_{safe_name}.csv"
-    df_out.to_csv(out_path, index=False)
+    out_path  = Path(out_dir) / f"labels_{safe_name}.parquet"
+    df.to_parquet(out_path, index=False, compression="zstd")
     print(f"[DONE] wrote → {out_path}")
 
 # ─── CLI ────────────────────────────────────────────────────────────
@@ -8,20 +8,29 @@
 #          -o data/flat/model_labels \
 #          -m deepseek-chat
 # ----------------------------------------------------------------
-import os, json, time, argparse, textwrap, re
+import os, asyncio, argparse, functools, hashlib
 from pathlib import Path
 
 import pandas as pd
-import requests
+import aiohttp
 import backoff
-from tqdm import tqdm
+import orjson
+import diskcache
+from aiolimiter import AsyncLimiter
+from tqdm.asyncio import tqdm
+
+from label_io import truncate_post, first_json_block
 
 # ─── CONFIG ────────────────────────────────────────────────────
+MIN_CHARS   = 20             # shorter bodies are never sent
 MAX_CHARS   = 4_000          # truncate only if >4 k characters
-SLEEP       = 0.3            # polite pause between API calls
+CONCURRENCY = 64             # requests in flight (= connection pool size)
+RPM         = 300            # requests per minute
+TPM         = 300_000        # estimated tokens per minute
 TEMP        = 0.0            # deterministic output
 N_LABELS    = 3              # keep max 3 labels per post
 DEBUG_ROWS  = 3              # print first N raw replies for inspection
+CACHE       = diskcache.Cache("data/cache/deepseek")   # labels by (model, prompt)
 
 CATEGORIES = {
     "experience":        "Personal narrative of one's condition, symptoms, or story.",
@@ -37,99 +46,159 @@ CATEGORIES = {
 }
 
 BASE_URL = "https://api.deepseek.com/v1/chat/completions"
+CAT_SET     = frozenset(CATEGORIES)      # membership checks on replies
 LABEL_BLOCK = "\n".join(f"- {k}" for k in CATEGORIES)
 
+# request and token budgets, shared by every call (retries included)
+rpm_limiter = AsyncLimiter(RPM, 60)
+tpm_limiter = AsyncLimiter(TPM, 60)
+
 # ─── BUILD PROMPT / PAYLOAD ────────────────────────────────────
-def build_payload(model: str, text: str) -> dict:
-    snippet = text if len(text) <= MAX_CHARS else textwrap.shorten(
-        text, MAX_CHARS, placeholder=" (…)")
-
-    prompt = (
-        f"POST:\n{snippet}\n\n"
-        "You are a medical text-classification assistant.\n"
-        "Choose ONLY the labels that apply (max 3).\n"
-        f"Allowed labels:\n{LABEL_BLOCK}\n\n"
-        'Return exactly this JSON – **no commentary, no markdown**:\n'
-        '{"labels":["label1","label2"]}'
-    )
-
-    return {
+POST_MARK   = "@@POST@@"
+PROMPT_TAIL = (
+    "\n\n"
+    "You are a medical text-classification assistant.\n"
+    "Choose ONLY the labels that apply (max 3).\n"
+    f"Allowed labels:\n{LABEL_BLOCK}\n\n"
+    'Return exactly this JSON – **no commentary, no markdown**:\n'
+    '{"labels":["label1","label2"]}'
+)
+
+@functools.lru_cache(maxsize=4)
+def payload_skeleton(model: str) -> tuple[bytes, bytes]:
+    """Request body serialised once per model, split around the post."""
+    body = orjson.dumps({
         "model": model,
         "messages": [
             {"role": "system",
              "content": "Reply ONLY with a JSON object."},
-            {"role": "user", "content": prompt}
+            {"role": "user", "content": f"POST:\n{POST_MARK}{PROMPT_TAIL}"}
         ],
         # Tell DeepSeek we expect JSON
         "response_format": {"type": "json_object"},
         "temperature": TEMP
-    }
+    })
+    head, tail = body.split(POST_MARK.encode())
+    return head, tail
+
+def build_payload(model: str, text: str) -> bytes:
+    """JSON request body: static skeleton + the escaped post snippet."""
+    snippet = truncate_post(text, MAX_CHARS)
+    head, tail = payload_skeleton(model)
+    return head + orjson.dumps(snippet)[1:-1] + tail
+
+def estimate_tokens(payload: bytes) -> int:
+    """Prompt tokens by the ~4 bytes/token rule, plus room for the reply."""
+    return min(TPM, len(payload) // 4 + 32)
+
+def cache_key(payload: bytes) -> str:
+    """The body already holds model, prompt and temperature."""
+    return hashlib.sha256(payload).hexdigest()
+
+def parse_labels(content: str) -> list[str] | None:
+    """
+    Labels from a reply: strict JSON first, else the first {...} block.
+    None if neither holds a {"labels": [...]} object, or none of its
+    labels is in CATEGORIES.
+    """
+    for text in (content, first_json_block(content)):
+        if not text:
+            continue
+        try:
+            obj = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            continue
+        if isinstance(obj, dict) and isinstance(obj.get("labels"), list):
+            labels = [l for l in obj["labels"]
+                      if isinstance(l, str) and l in CAT_SET]
+            return labels if labels or not obj["labels"] else None
+    return None
 
 # ─── API CALL WITH RETRY + FALLBACK PARSER ─────────────────────
 @backoff.on_exception(backoff.expo,
-                      (requests.exceptions.RequestException,),
+                      (aiohttp.ClientError, asyncio.TimeoutError),
                       max_tries=4, factor=2)
-def deepseek_labels(model: str, post_txt: str, row_idx: int = 0) -> list[str]:
+async def deepseek_labels(session: aiohttp.ClientSession, model: str,
+                          post_txt: str, row_idx: int = 0) -> list[str]:
+    payload = build_payload(model, post_txt)
+    key     = cache_key(payload)
+    if key in CACHE:                          # crosspost / repost seen before
+        return CACHE[key]
+
+    async with rpm_limiter:
+        await tpm_limiter.acquire(estimate_tokens(payload))
+        async with session.post(BASE_URL, data=payload) as resp:
+            if resp.status != 200:
+                raise aiohttp.ClientResponseError(
+                    resp.request_info, resp.history, status=resp.status,
+                    message=f"{(await resp.text())[:120]}…")
+            reply   = orjson.loads(await resp.read())
+            content = reply["choices"][0]["message"]["content"]
+
+    # DEBUG – show first few raw responses
+    if row_idx < DEBUG_ROWS:
+        print(f"\n↳ RAW reply #{row_idx+1} → {content[:160].replace(chr(10),' ')}\n")
+
+    labels = parse_labels(content)
+    if labels is None:                        # unusable reply – retry next run
+        return []
+    labels = labels[:N_LABELS]
+    CACHE[key] = labels
+    return labels
+
+# ─── MAIN DRIVER ───────────────────────────────────────────────
+async def label_all(model: str, bodies) -> list[str]:
+    """Label every body over one pooled session; results keep input order."""
     api_key = os.environ.get("DEEPSEEK_API_KEY")
     if not api_key:
         raise RuntimeError("Set DEEPSEEK_API_KEY env-var first.")
 
+    # auth headers built once – the session sends them with every call
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type":  "application/json"
     }
-    resp = requests.post(
-        BASE_URL,
-        headers=headers,
-        json=build_payload(model, post_txt),
-        timeout=120
-    )
-    if resp.status_code != 200:
-        raise requests.HTTPError(f"[{resp.status_code}] {resp.text[:120]}…")
-
-    content = resp.json()["choices"][0]["message"]["content"]
-
-    # DEBUG – show first few raw responses
-    if row_idx < DEBUG_ROWS:
-        print(f"\n↳ RAW reply #{row_idx+1} → {content[:160].replace(chr(10),' ')}\n")
+    sem       = asyncio.Semaphore(CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    timeout   = aiohttp.ClientTimeout(total=120)
 
-    # 1) strict attempt – should succeed if JSON-only came back
-    try:
-        labels = json.loads(content)["labels"]
-    except Exception:
-        # 2) fallback: extract the first {...} block & parse
-        m = re.search(r"{.*}", content, re.S)
-        try:
-            labels = json.loads(m.group(0))["labels"] if m else []
-        except Exception:
-            labels = []
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     headers=headers) as session:
+        async def _bounded(i: int, txt: str) -> str:
+            async with sem:
+                return ";".join(await deepseek_labels(session, model, str(txt), i))
 
-    # filter + cap
-    return [l for l in labels if l in CATEGORIES][:N_LABELS]
+        return await tqdm.gather(*(_bounded(i, t) for i, t in enumerate(bodies)),
+                                 desc="Labelling", unit="post")
 
-# ─── MAIN DRIVER ───────────────────────────────────────────────
 def main(input_csv: str, out_dir: str, model: str):
-    df = pd.read_csv(input_csv)
+    # keys + body only – other post columns are never sent or used
+    df = pd.read_csv(input_csv, usecols=["subreddit", "post_id", "body"],
+                     dtype=str, keep_default_na=False)
     out_dir = Path(out_dir); out_dir.mkdir(parents=True, exist_ok=True)
     safe_model = model.replace("/", "_")
-    out_path   = out_dir / f"labels_{safe_model}.csv"
-
-    results = []
-    for i, txt in enumerate(tqdm(df["body"].fillna(""), desc="Labelling", unit="post")):
-        results.append(";".join(deepseek_labels(model, str(txt), i)))
-        time.sleep(SLEEP)
-
-    df_out = df.copy()
-    df_out["labels"] = results
-    df_out.to_csv(out_path, index=False)
+    out_path   = out_dir / f"labels_{safe_model}.parquet"
+
+    # identical bodies share one request
+    unique = df["body"].drop_duplicates()
+    # empty / link-only bodies can't carry a label – don't pay for them
+    short  = unique.str.strip().str.len() < MIN_CHARS
+    print(f"[INFO] {len(unique):,} unique bodies of {len(df):,} rows "
+          f"({short.sum():,} under {MIN_CHARS} chars skipped)")
+    labels_map = dict.fromkeys(unique[short], "")
+    labels_map.update(zip(unique[~short],
+                          asyncio.run(label_all(model, unique[~short]))))
+
+    df["labels"] = df["body"].map(labels_map)      # df is ours – no copy
+    df.to_parquet(out_path, index=False, compression="zstd")
     print(f"\n[DONE] wrote → {out_path}")
 
     # ─ sanity summary ─
-    check = df_out["labels"].fillna("")
+    check = df["labels"].fillna("")
     flat  = [lab for row in check.str.split(";") for lab in row if lab]
     print("\nSummary")
     print("───────")
-    print(f"Posts processed:  {len(df_out):6,d}")
+    print(f"Posts processed:  {len(df):6,d}")
     print(f"Empty-label rows: {(check == '').sum():6,d}")
     print(f"Distinct labels:  {len(set(flat)):6,d} → {sorted(set(flat))}")
 
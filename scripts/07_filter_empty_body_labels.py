@@ -2,28 +2,64 @@
 # 07_filter_empty_body_labels.py
 # -------------------------------------------------------------------
 # Remove any rows whose `body` column is empty or missing,
-# producing a cleaned CSV (e.g., labels_<model>-v2.csv).
+# producing a cleaned file (e.g., labels_<model>-v2.parquet).
+# Parquet or CSV in, Parquet or CSV out – picked by file suffix.
 # Usage:
 #   python scripts/07_filter_empty_body_labels.py \
-#     -i data/flat/model_labels/labels_MODEL.csv \
-#     -o data/flat/model_labels/labels_MODEL-v2.csv
+#     -i data/flat/model_labels/labels_MODEL.parquet \
+#     -o data/flat/model_labels/labels_MODEL-v2.parquet
 # -------------------------------------------------------------------
 import argparse
+import csv
 from pathlib import Path
-import pandas as pd
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+BLOCK_SIZE = 8 << 20          # bytes per streamed batch
+
+def open_batches(path: Path):
+    """(schema, batch iterator) for a Parquet or CSV file."""
+    if path.suffix == ".parquet":
+        pf = pq.ParquetFile(path)
+        return pf.schema_arrow, pf.iter_batches()
+
+    # every CSV column as plain text: no per-batch type guessing, values
+    # are written back exactly as they were read
+    with open(path, newline="", encoding="utf-8") as fh:
+        header = next(csv.reader(fh))
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=BLOCK_SIZE, use_threads=True),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in header}),
+    )
+    return reader.schema, reader
 
 def main(input_path: str, output_path: str):
-    df = pd.read_csv(input_path)
-    # Keep only rows where `body` is non-null and not just whitespace
-    mask = df['body'].fillna('').astype(str).str.strip() != ''
-    df_filtered = df.loc[mask]
+    schema, batches = open_batches(Path(input_path))
 
     # Ensure output directory exists
     out_path = Path(output_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
+    writer = (pq.ParquetWriter(out_path, schema, compression="zstd")
+              if out_path.suffix == ".parquet"
+              else pacsv.CSVWriter(out_path, schema))
+
+    n_rows = 0
+    with writer:
+        for batch in batches:
+            # Keep only rows where `body` is non-null and not just whitespace
+            body = pc.fill_null(batch.column("body"), "")
+            mask = pc.not_equal(pc.utf8_length(pc.utf8_trim_whitespace(body)), 0)
+            filtered = batch.filter(mask)
+            writer.write_batch(filtered)
+            n_rows += filtered.num_rows
 
-    df_filtered.to_csv(out_path, index=False)
-    print(f"[DONE] wrote {len(df_filtered):,} rows → {out_path}")
+    print(f"[DONE] wrote {n_rows:,} rows → {out_path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -31,11 +67,11 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         '-i', '--input', required=True,
-        help='Path to input CSV'
+        help='Path to input Parquet / CSV'
     )
     parser.add_argument(
         '-o', '--output', required=True,
-        help='Path to output filtered CSV'
+        help='Path to output filtered Parquet / CSV'
     )
     args = parser.parse_args()
     main(args.input, args.output)
@@ -5,70 +5,112 @@
 # Example:
 #   python scripts/06_multi_label_consensus.py \
 #          -i data/flat/model_labels \
-#          -o data/flat/model_labels/labels_consensus.csv
+#          -o data/flat/model_labels/labels_consensus.parquet
 #
 # The input *can be* either
-#   • a directory  (every file whose name starts with ‘labels_’ is loaded), OR
-#   • an explicit comma-separated list of CSV files.
+#   • a directory  (every labels_*.parquet / labels_*.csv is loaded), OR
+#   • an explicit comma-separated list of Parquet / CSV files.
 # -------------------------------------------------------------------
 import argparse
 import pathlib
 import sys
-from collections import Counter, defaultdict
+from collections import defaultdict
 
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
-# ────────────────────────────────────────────────────────────────────
-# helper
-# ────────────────────────────────────────────────────────────────────
-def normalise_labels(cell: str | float) -> list[str]:
-    """Split “a;b;c” → ['a','b','c']; tolerate NaN/empty."""
-    if not isinstance(cell, str):
-        return []
-    return [lbl.strip() for lbl in cell.split(";") if lbl.strip()]
+KEY_COLS = ["subreddit", "post_id"]
+# the fixed 10-label vocabulary of the 06* labellers; sorted so that the
+# category codes order labels the same way sorted() does
+LABEL_DTYPE = pd.CategoricalDtype(sorted([
+    "experience", "clinical", "advice_seeking", "advice_giving",
+    "emotional_support", "emotional_share", "lifestyle", "community",
+    "news", "off_topic",
+]))
 
 # ────────────────────────────────────────────────────────────────────
-def read_label_file(fp: pathlib.Path) -> pd.DataFrame:
-    df = pd.read_csv(fp, dtype=str, keep_default_na=False)
-    key_cols = ["subreddit", "post_id"]
-    if not all(k in df.columns for k in key_cols):
-        sys.exit(f"❌  {fp.name} missing key columns {key_cols}")
+def read_table(fp: pathlib.Path, columns: list[str] | None = None) -> pd.DataFrame:
+    """Parquet (only *columns*) or CSV, every value as str, NaN → ''."""
+    if fp.suffix == ".parquet":
+        df = pd.read_parquet(fp, columns=columns)
+        return df.astype(str).mask(df.isna(), "")
+    return pd.read_csv(fp, dtype=str, keep_default_na=False, usecols=columns)
 
-    dups = df.duplicated(subset=key_cols, keep=False).sum()
+def read_label_file(fp: pathlib.Path) -> pd.DataFrame:
+    try:
+        df = read_table(fp, [*KEY_COLS, "labels"])
+    except (KeyError, ValueError):          # column pushdown found a gap
+        sys.exit(f"❌  {fp.name} missing columns {[*KEY_COLS, 'labels']}")
+    if not all(k in df.columns for k in KEY_COLS):
+        sys.exit(f"❌  {fp.name} missing key columns {KEY_COLS}")
+
+    dups = df.duplicated(subset=KEY_COLS, keep=False).sum()
     if dups:
         print(f"[WARN] {fp.name}: dropping {dups} duplicate rows")
-        df = df.drop_duplicates(subset=key_cols, keep="first")
+        df = df.drop_duplicates(subset=KEY_COLS, keep="first")
 
     return (
-        df.set_index(key_cols)[["labels"]]
+        df.set_index(KEY_COLS)[["labels"]]
         .rename(columns={"labels": fp.stem})  # header == file stem
     )
 
 
 # ────────────────────────────────────────────────────────────────────
-def consensus_vote(row: pd.Series, thr: int) -> str:
+def consensus_vote(merged: pd.DataFrame, thr: int) -> pd.Series:
     """
-    row = one Pandas row with N model-columns each holding “a;b”.
-    Return labels joined by ‘;’ that reach ≥ thr votes across models.
+    merged = one column per model, each cell holding “a;b”.
+    Return, per row, the labels joined by ‘;’ that reach ≥ thr votes.
+    Votes land in a rows × 10 count matrix via one bincount; each row's
+    kept labels become a 10-bit mask, so only distinct masks get joined.
     """
-    votes: Counter[str] = Counter()
-    for cell in row.dropna():
-        votes.update(normalise_labels(cell))
-    keep = [lab for lab, n in votes.items() if n >= thr]
-    return ";".join(sorted(keep))
+    n, n_models = merged.shape
+    n_labels    = len(LABEL_DTYPE.categories)
+
+    # row-major ravel: flat position // n_models is the row number
+    votes = pd.Series(merged.to_numpy().ravel()).str.split(";").explode()
+    votes = votes.str.strip()
+    votes = votes[votes.fillna("") != ""]                # NaN / empty cells
+
+    codes   = pd.Categorical(votes, dtype=LABEL_DTYPE).codes
+    unknown = int((codes < 0).sum())
+    if unknown:
+        print(f"[WARN] ignoring {unknown:,} votes for labels outside the vocabulary")
+    rows = votes.index.to_numpy() // n_models
+    rows, codes = rows[codes >= 0], codes[codes >= 0]
+
+    counts = np.bincount(rows * n_labels + codes, minlength=n * n_labels)
+    keep   = counts.reshape(n, n_labels) >= thr
+    masks  = keep @ (1 << np.arange(n_labels))
+    # categories are sorted, so bit order == sorted() order of the labels
+    names  = {m: ";".join(lab for j, lab in enumerate(LABEL_DTYPE.categories)
+                          if m >> j & 1)
+              for m in np.unique(masks)}
+    return pd.Series(masks, index=merged.index).map(names)
 
 # ────────────────────────────────────────────────────────────────────
-def main(in_arg: str, out_csv: str, vote_threshold: int) -> None:
+def main(in_arg: str, out_path: str, vote_threshold: int) -> None:
     in_paths: list[pathlib.Path]
+    out_fp = pathlib.Path(out_path)
     p = pathlib.Path(in_arg)
     if p.is_dir():
-        in_paths = sorted(p.glob("labels_*.csv"))
+        found = [f for ext in ("parquet", "csv")
+                 for f in p.glob(f"labels_*.{ext}")
+                 if f.resolve() != out_fp.resolve()]            # not our output
     else:
-        in_paths = [pathlib.Path(x.strip()) for x in in_arg.split(",")]
+        found = [pathlib.Path(x.strip()) for x in in_arg.split(",")]
+
+    # one file per model: an old labels_X.csv next to labels_X.parquet
+    # would otherwise give that model two votes (Parquet wins)
+    by_model: dict[str, pathlib.Path] = {}
+    for f in found:
+        if f.stem not in by_model or f.suffix == ".parquet":
+            by_model[f.stem] = f
+    in_paths = sorted(by_model.values())
+    for f in sorted(set(found) - set(in_paths)):
+        print(f"[INFO] ignoring {f.name} – {by_model[f.stem].name} is used")
 
     if len(in_paths) < 2:
-        sys.exit("❌  Need at least TWO per-model CSVs for a consensus")
+        sys.exit("❌  Need label files from at least TWO models for a consensus")
 
     # --- load & merge ------------------------------------------------
     dfs = [read_label_file(fp) for fp in in_paths]
@@ -76,15 +118,11 @@ def main(in_arg: str, out_csv: str, vote_threshold: int) -> None:
     print(f"[INFO] {len(merged):,} rows present in ALL {len(dfs)} files")
 
     # --- compute consensus ------------------------------------------
-    merged["consensus_labels"] = tqdm(
-        merged.apply(consensus_vote, axis=1, thr=vote_threshold),
-        total=len(merged),
-        desc="Consensus"
-    )
+    merged["consensus_labels"] = consensus_vote(merged, vote_threshold)
 
     # --- attach back the non-label columns (take them from the 1st file) ---
-    base_df = pd.read_csv(in_paths[0], dtype=str, keep_default_na=False)
-    base_df = base_df.set_index(["subreddit", "post_id"])
+    base_df = read_table(in_paths[0])
+    base_df = base_df.set_index(KEY_COLS)
     final = base_df.join(merged[["consensus_labels"]])
 
     # --- statistics / sanity check ----------------------------------
@@ -103,29 +141,31 @@ def main(in_arg: str, out_csv: str, vote_threshold: int) -> None:
     )
 
     # --- write -------------------------------------------------------
-    out_fp = pathlib.Path(out_csv)
     out_fp.parent.mkdir(parents=True, exist_ok=True)
-    final.reset_index().to_csv(out_fp, index=False)
+    if out_fp.suffix == ".parquet":
+        final.reset_index().to_parquet(out_fp, index=False, compression="zstd")
+    else:
+        final.reset_index().to_csv(out_fp, index=False)
     print(f"\n[SAVED] {out_fp}\n")
 
 # ────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
     ap = argparse.ArgumentParser(
-        description="Majority-vote merge of model label CSVs"
+        description="Majority-vote merge of model label files"
     )
     ap.add_argument(
         "-i", "--input",
         required=True,
         help=(
-            "Directory containing per-model CSVs  *or*  a comma-separated list "
-            "of CSV files (each file must contain ‘labels’ column plus "
-            "subreddit & post_id)."
+            "Directory containing per-model Parquet/CSV files  *or*  a "
+            "comma-separated list of them (each file must contain ‘labels’ "
+            "column plus subreddit & post_id)."
         ),
     )
     ap.add_argument(
         "-o", "--output",
-        default="data/flat/model_labels/labels_consensus.csv",
-        help="Output CSV path"
+        default="data/flat/model_labels/labels_consensus.parquet",
+        help="Output path (.parquet, or .csv)"
     )
     ap.add_argument(
         "-t", "--threshold",
@@ -4,21 +4,21 @@
 import pandas as pd, numpy as np, matplotlib.pyplot as plt
 from pathlib import Path
 
-LABELS   = Path("data/flat/model_labels/labels_consensus.csv")
+LABELS   = Path("data/flat/model_labels/labels_consensus.parquet")
 POSTS    = Path("data/flat/selected_high_signal_posts.csv")
 OUT_DIR  = Path("results");  OUT_DIR.mkdir(exist_ok=True, parents=True)
 
 # 1️⃣  merge
 posts = pd.read_csv(POSTS, dtype=str)
-labs  = pd.read_csv(LABELS, dtype=str)
-df    = posts.merge(labs[["subreddit","post_id","consensus_labels"]],
-                    on=["subreddit","post_id"], how="left")
+labs  = pd.read_parquet(LABELS, columns=["subreddit","post_id","consensus_labels"])
+df    = posts.merge(labs, on=["subreddit","post_id"], how="left")
 df.to_parquet(OUT_DIR/"posts_annotated.parquet", index=False)
 
 # 2️⃣  label frequency sanity plot
-labs_long = (df["consensus_labels"]
-             .str.split(";", expand=True)
-             .stack().value_counts())
+# one flat array of labels – no rows × max-labels frame to build and stack
+flat      = np.concatenate([s.split(";") for s in df["consensus_labels"].dropna()]
+                           or [np.array([], dtype=str)])
+labs_long = pd.Series(flat[flat != ""], dtype="category").value_counts()
 labs_long.plot(kind="barh")
 plt.gca().invert_yaxis(); plt.tight_layout()
 plt.savefig(OUT_DIR/"label_freq.png", dpi=300)
@@ -27,12 +27,13 @@ plt.close()
 # 3️⃣  latency summary per label
 lat = df.assign(label=df["consensus_labels"].str.split(";")) \
         .explode("label")
+lat["label"] = lat["label"].astype("category")
 lat["latency_min"] = pd.to_numeric(lat["latency_min"], errors="coerce")
-summary = (lat.groupby("label")["latency_min"]
-              .agg(n_posts="size",
-                   median_min="median",
-                   iqr_min=lambda x: np.subtract(*np.percentile(
-                                     x.dropna(), [75,25]))))
+by_label = lat.groupby("label", observed=True)["latency_min"]
+q        = by_label.quantile([0.25, 0.75]).unstack()   # NaN-aware, one pass
+summary  = pd.DataFrame({"n_posts":    by_label.size(),
+                         "median_min": by_label.median(),
+                         "iqr_min":    q[0.75] - q[0.25]})
 summary.to_csv(OUT_DIR/"latency_by_label.csv")
 print(summary.head())
 
@@ -0,0 +1,46 @@
+"""
+dump_io.py
+────────────────────────────────────────────────────────
+Shared open() for the raw Reddit dumps in data/raw*/.
+
+New dumps are written as zstd (.jsonl.zst, multi-threaded, level 6);
+older .jsonl.gz and plain .jsonl files are still read transparently –
+the codec is picked from the file suffix.
+"""
+
+import gzip, io, pathlib
+import zstandard as zstd
+
+ZST_LEVEL     = 6
+DUMP_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+
+def open_zst(path, mode="rt"):
+    """gzip.open()-style opener for .zst: mode 'r'/'w' + 't'/'b'."""
+    path = pathlib.Path(path)
+    if "w" in mode:
+        cctx = zstd.ZstdCompressor(level=ZST_LEVEL, threads=-1)   # all cores
+        raw  = cctx.stream_writer(path.open("wb"), closefd=True)
+        return raw if "b" in mode else io.TextIOWrapper(raw, encoding="utf-8")
+
+    raw = zstd.ZstdDecompressor().stream_reader(path.open("rb"), closefd=True)
+    buf = io.BufferedReader(raw)                                  # line iteration
+    return buf if "b" in mode else io.TextIOWrapper(buf, encoding="utf-8")
+
+def open_dump(path, mode="rt"):
+    """Open a .jsonl / .jsonl.gz / .jsonl.zst dump by suffix."""
+    name = str(path)
+    if name.endswith(".zst"):
+        return open_zst(path, mode)
+    if name.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8" if "t" in mode else None)
+    return open(path, mode, encoding="utf-8" if "t" in mode else None)
+
+def list_dumps(directory, prefix=""):
+    """Sorted dump files in *directory* (partial downloads excluded)."""
+    directory = pathlib.Path(directory)
+    return sorted(p for p in directory.glob(f"{prefix}*.jsonl*")
+                  if p.name.endswith(DUMP_SUFFIXES))
+
+def dump_stem(path) -> str:
+    """r_foo.jsonl.zst → r_foo"""
+    return pathlib.Path(path).name.split(".jsonl")[0]
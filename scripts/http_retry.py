@@ -0,0 +1,26 @@
+"""
+http_retry.py
+────────────────────────────────────────────────────────
+Shared Retry-After handling for the API scripts (02*, 03c).
+
+The header is either delta-seconds ("20") or an HTTP-date
+("Wed, 21 Oct 2015 07:28:00 GMT"); anything unparsable falls back
+to the caller's default so a retry loop never dies on a header.
+"""
+
+import email.utils, time
+
+def retry_after_s(headers, default: float = 0.0) -> float:
+    """Seconds a Retry-After header asks us to wait (≥ 0), else *default*."""
+    value = (headers or {}).get("retry-after")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max(0.0, when.timestamp() - time.time())
@@ -0,0 +1,41 @@
+"""
+label_io.py
+────────────────────────────────────────────────────────
+Shared prompt / reply helpers for the 06* labelling scripts:
+post truncation on the way out, JSON extraction on the way back.
+"""
+
+def truncate_post(text: str, max_chars: int) -> str:
+    """Cut a long post at the last full word before max_chars, marked “ (…)”."""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " (…)"
+
+def first_json_block(raw: str) -> str | None:
+    """
+    First balanced {...} block in raw text (nested objects included).
+    Braces inside JSON strings ("uses {x}") don't count; \\" and \\\\
+    escapes are honoured.  None if there is no block or it never closes.
+    """
+    start = raw.find("{")
+    if start < 0:
+        return None
+    depth, in_str, escaped = 0, False, False
+    for j in range(start, len(raw)):
+        c = raw[j]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_str = False
+        elif c == '"':
+            in_str = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return raw[start:j + 1]
+    return None                                # unbalanced – truncated reply